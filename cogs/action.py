@@ -5,11 +5,12 @@ import datetime
 from utils.checks import has_role
 from utils.time_parser import parse_time
 from utils.helpers import (
-    load_punishments, save_punishments,
-    add_punishment, remove_punishment,
-    has_active_punishment, count_punishments, count_nicknames
+    add_punishment, remove_punishment, has_active_punishment,
+    get_user_punishments, get_punishment_history, get_punishment_status
 )
 from utils.logger import log_action
+from utils.dm import dms
+from utils.rest_queue import rest
 
 # ============================================================
 # Названия типов наказаний (для DM-уведомлений)
@@ -205,10 +206,8 @@ class Action(commands.Cog):
         await log_action(guild, self.config["log_channel"], embed)
 
     async def _dm_user(self, user, embed: disnake.Embed):
-        try:
-            await user.send(embed=embed)
-        except Exception:
-            pass
+        # ЛС доставляются в фоне; ответ модератору их не ждёт
+        dms.send(user, embed=embed)
 
     # ========== Обработчики действий ==========
 
@@ -223,7 +222,7 @@ class Action(commands.Cog):
         if not ban_role:
             await inter.response.send_message("❌ Роль бана не настроена.", ephemeral=True)
             return
-        if has_active_punishment(target.id, ban_role):
+        if has_active_punishment(target.guild.id, target.id, ban_role):
             await inter.response.send_message("❌ Пользователь уже забанен.", ephemeral=True)
             return
         modal = BanModal(self, target)
@@ -240,7 +239,7 @@ class Action(commands.Cog):
         if not ban_role:
             await inter.response.send_message("❌ Роль бана не настроена.", ephemeral=True)
             return
-        if not has_active_punishment(target.id, ban_role):
+        if not has_active_punishment(target.guild.id, target.id, ban_role):
             await inter.response.send_message("❌ У пользователя нет активного бана.", ephemeral=True)
             return
         modal = UnbanModal(self, target)
@@ -254,7 +253,7 @@ class Action(commands.Cog):
             await inter.response.send_message("❌ Пользователь не найден.", ephemeral=True)
             return
         role_id = self.config["roles"].get("ostranenie")
-        if role_id and has_active_punishment(target.id, role_id):
+        if role_id and has_active_punishment(target.guild.id, target.id, role_id):
             await inter.response.send_message("❌ У пользователя уже есть активное отстранение.", ephemeral=True)
             return
         modal = SuspensionModal(self, target)
@@ -268,7 +267,7 @@ class Action(commands.Cog):
             await inter.response.send_message("❌ Пользователь не найден.", ephemeral=True)
             return
         role_id = self.config["roles"].get("ostranenie")
-        if not role_id or not has_active_punishment(target.id, role_id):
+        if not role_id or not has_active_punishment(target.guild.id, target.id, role_id):
             await inter.response.send_message("❌ У пользователя нет активного отстранения.", ephemeral=True)
             return
         modal = UnsuspensionModal(self, target)
@@ -296,7 +295,7 @@ class Action(commands.Cog):
             for b in ["support", "moderator", "control", "admin"]
             if self.config["roles"].get(f"warn_{b}")
         ]
-        if not any(has_active_punishment(target.id, rid) for rid in warn_roles if rid):
+        if not any(has_active_punishment(target.guild.id, target.id, rid) for rid in warn_roles if rid):
             await inter.response.send_message("❌ У пользователя нет активных предупреждений.", ephemeral=True)
             return
         modal = UnwarnModal(self, target)
@@ -310,7 +309,7 @@ class Action(commands.Cog):
             await inter.response.send_message("❌ Пользователь не найден.", ephemeral=True)
             return
         role_id = self.config["roles"].get("remark")
-        if role_id and has_active_punishment(target.id, role_id):
+        if role_id and has_active_punishment(target.guild.id, target.id, role_id):
             await inter.response.send_message("❌ У пользователя уже есть активное замечание.", ephemeral=True)
             return
         modal = RemarkModal(self, target)
@@ -324,7 +323,7 @@ class Action(commands.Cog):
             await inter.response.send_message("❌ Пользователь не найден.", ephemeral=True)
             return
         role_id = self.config["roles"].get("remark")
-        if not role_id or not has_active_punishment(target.id, role_id):
+        if not role_id or not has_active_punishment(target.guild.id, target.id, role_id):
             await inter.response.send_message("❌ У пользователя нет активного замечания.", ephemeral=True)
             return
         modal = UnremarkModal(self, target)
@@ -351,7 +350,7 @@ class Action(commands.Cog):
         if not role_id:
             await inter.response.send_message("❌ Роль мута не настроена.", ephemeral=True)
             return
-        if has_active_punishment(target.id, role_id):
+        if has_active_punishment(target.guild.id, target.id, role_id):
             await inter.response.send_message(
                 f"❌ У пользователя уже есть {'текстовый' if mute_type == 'text' else 'голосовой'} мут.",
                 ephemeral=True
@@ -369,8 +368,8 @@ class Action(commands.Cog):
             return
         mute_text_role = self.config["roles"].get("mute_text")
         mute_voice_role = self.config["roles"].get("mute_voice")
-        text_mute = has_active_punishment(target.id, mute_text_role) if mute_text_role else False
-        voice_mute = has_active_punishment(target.id, mute_voice_role) if mute_voice_role else False
+        text_mute = has_active_punishment(target.guild.id, target.id, mute_text_role) if mute_text_role else False
+        voice_mute = has_active_punishment(target.guild.id, target.id, mute_voice_role) if mute_voice_role else False
         if not (text_mute or voice_mute):
             await inter.response.send_message("❌ У пользователя нет активного мута.", ephemeral=True)
             return
@@ -422,7 +421,7 @@ class Action(commands.Cog):
         if not nedopusk_role:
             await inter.response.send_message("❌ Роль недопуска не настроена.", ephemeral=True)
             return
-        if has_active_punishment(target.id, nedopusk_role):
+        if has_active_punishment(target.guild.id, target.id, nedopusk_role):
             await inter.response.send_message("❌ У пользователя уже есть недопуск.", ephemeral=True)
             return
         modal = NedopuskModal(self, target)
@@ -439,7 +438,7 @@ class Action(commands.Cog):
         if not nedopusk_role:
             await inter.response.send_message("❌ Роль недопуска не настроена.", ephemeral=True)
             return
-        if not has_active_punishment(target.id, nedopusk_role):
+        if not has_active_punishment(target.guild.id, target.id, nedopusk_role):
             await inter.response.send_message("❌ У пользователя нет недопуска.", ephemeral=True)
             return
         modal = UnNedopuskModal(self, target)
@@ -451,8 +450,7 @@ class Action(commands.Cog):
             return
         if not target:
             target = inter.author
-        data = load_punishments()
-        user_data = data.get(str(target.id), [])
+        user_data = get_punishment_history(target.guild.id, target.id, 10)
         if not user_data:
             await inter.response.send_message("📭 История нарушений отсутствует.", ephemeral=True)
             return
@@ -461,7 +459,7 @@ class Action(commands.Cog):
             color=0xe67e22
         )
         embed.set_thumbnail(url=target.display_avatar.url)
-        for i, p in enumerate(user_data[-10:], 1):
+        for i, p in enumerate(user_data, 1):
             dt = datetime.datetime.fromtimestamp(p["issued_at"]).strftime("%d.%m.%Y %H:%M")
             embed.add_field(
                 name=f"{i}. {p['type']} ({dt})",
@@ -488,7 +486,7 @@ class Action(commands.Cog):
             for b in ["support", "moderator", "control", "admin"]
             if self.config["roles"].get(f"warn_{b}")
         ]
-        if any(has_active_punishment(target.id, rid) for rid in warn_roles if rid):
+        if any(has_active_punishment(target.guild.id, target.id, rid) for rid in warn_roles if rid):
             await inter.response.send_message("❌ У пользователя уже есть активный выговор.", ephemeral=True)
             return
         view = ReprimandBranchView(self, target)
@@ -506,7 +504,7 @@ class Action(commands.Cog):
             for b in ["support", "moderator", "control", "admin"]
             if self.config["roles"].get(f"warn_{b}")
         ]
-        if not any(has_active_punishment(target.id, rid) for rid in warn_roles if rid):
+        if not any(has_active_punishment(target.guild.id, target.id, rid) for rid in warn_roles if rid):
             await inter.response.send_message("❌ У пользователя нет активных выговоров.", ephemeral=True)
             return
         modal = UnreprimandModal(self, target)
@@ -524,7 +522,7 @@ class Action(commands.Cog):
             for b in ["support", "moderator", "control", "admin", "common"]
             if self.config["roles"].get(f"chs_{b}")
         ]
-        if any(has_active_punishment(target.id, rid) for rid in chs_roles if rid):
+        if any(has_active_punishment(target.guild.id, target.id, rid) for rid in chs_roles if rid):
             await inter.response.send_message("❌ У пользователя уже есть ЧС.", ephemeral=True)
             return
         view = CHSBranchView(self, target)
@@ -542,7 +540,7 @@ class Action(commands.Cog):
             for b in ["support", "moderator", "control", "admin", "common"]
             if self.config["roles"].get(f"chs_{b}")
         ]
-        if not any(has_active_punishment(target.id, rid) for rid in chs_roles if rid):
+        if not any(has_active_punishment(target.guild.id, target.id, rid) for rid in chs_roles if rid):
             await inter.response.send_message("❌ У пользователя нет активного ЧС.", ephemeral=True)
             return
         modal = UnCHSModal(self, target)
@@ -561,30 +559,26 @@ class ActionView(disnake.ui.View):
         self.target = target
         self.moderator = moderator
 
-        violations_count = count_punishments(target.id)
-        nick_count = count_nicknames(target.id)
+        # Один снимок вместо отдельного запроса на каждую роль
+        status = await get_punishment_status(target.guild.id, target.id)
+        active_roles = status["roles"]
+        violations_count = status["total"]
+        nick_count = status["nicknames"]
         roles = cog.config["roles"]
 
-        ban_role = roles.get("ban")
-        mute_text_role = roles.get("mute_text")
-        mute_voice_role = roles.get("mute_voice")
-        nedopusk_role = roles.get("nedopusk")
-        remark_role = roles.get("remark")
-        unverified_role = roles.get("unverified")
-        suspension_role = roles.get("ostranenie")
-
-        has_ban = has_active_punishment(target.id, ban_role) if ban_role else False
-        has_mute_text = has_active_punishment(target.id, mute_text_role) if mute_text_role else False
-        has_mute_voice = has_active_punishment(target.id, mute_voice_role) if mute_voice_role else False
-        has_nedopusk = has_active_punishment(target.id, nedopusk_role) if nedopusk_role else False
-        has_remark = has_active_punishment(target.id, remark_role) if remark_role else False
-        has_suspension = has_active_punishment(target.id, suspension_role) if suspension_role else False
-
-        warn_roles = [roles.get(f"warn_{b}") for b in ["support", "moderator", "control", "admin"] if roles.get(f"warn_{b}")]
-        has_warn = any(has_active_punishment(target.id, rid) for rid in warn_roles if rid)
+        def has(role_key):
+            role_id = roles.get(role_key)
+            return bool(role_id) and role_id in active_roles
 
-        chs_roles = [roles.get(f"chs_{b}") for b in ["support", "moderator", "control", "admin", "common"] if roles.get(f"chs_{b}")]
-        has_chs = any(has_active_punishment(target.id, rid) for rid in chs_roles if rid)
+        unverified_role = roles.get("unverified")
+        has_ban = has("ban")
+        has_mute_text = has("mute_text")
+        has_mute_voice = has("mute_voice")
+        has_nedopusk = has("nedopusk")
+        has_remark = has("remark")
+        has_suspension = has("ostranenie")
+        has_warn = any(has(f"warn_{b}") for b in ["support", "moderator", "control", "admin"])
+        has_chs = any(has(f"chs_{b}") for b in ["support", "moderator", "control", "admin", "common"])
 
         has_full = cog._has_full_access(moderator)
         is_mod = cog._check_permission(moderator, "moderator") or has_full
@@ -674,16 +668,15 @@ class GenderView(disnake.ui.View):
             await inter.response.send_message("❌ Роли верификации не настроены.", ephemeral=True)
             return
 
-        await self.target.remove_roles(inter.guild.get_role(male_role), reason="Смена пола")
-        await self.target.remove_roles(inter.guild.get_role(female_role), reason="Смена пола")
-        new_role = male_role if gender == "male" else female_role
-        await self.target.add_roles(inter.guild.get_role(new_role), reason="Смена пола / верификация")
-
+        new_role, old_role = (male_role, female_role) if gender == "male" else (female_role, male_role)
+        remove = [old_role]
         if not self.change and unverified_role:
-            await self.target.remove_roles(inter.guild.get_role(unverified_role), reason="Верификация")
+            remove.append(unverified_role)
+        await inter.response.defer(ephemeral=True)
+        await rest.edit_roles(self.target, add=[new_role], remove=remove, reason="Смена пола / верификация")
 
         gender_label = "мужской" if gender == "male" else "женский"
-        await inter.response.send_message(f"✅ Пол изменён на {gender_label}.", ephemeral=True)
+        await inter.edit_original_response(content=f"✅ Пол изменён на {gender_label}.")
         await self.cog._send_log(
             inter.guild,
             "Смена пола" if self.change else "Верификация",
@@ -774,8 +767,8 @@ class BanModal(disnake.ui.Modal):
 
         await inter.response.defer(ephemeral=True)
         role = inter.guild.get_role(role_id)
-        await self.target.edit(roles=[role])
-        add_punishment(self.target.id, "ban", role.id, end_time, reason)
+        await rest.set_roles(self.target, [role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, "ban", role.id, end_time, reason)
 
         log_embed = disnake.Embed(title="🔨 Бан", color=0xe74c3c)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -817,8 +810,8 @@ class UnbanModal(disnake.ui.Modal):
             return
 
         await inter.response.defer(ephemeral=True)
-        await self.target.remove_roles(role, reason=reason)
-        remove_punishment(self.target.id, role.id)
+        await rest.edit_roles(self.target, remove=[role], reason=reason)
+        remove_punishment(self.target.guild.id, self.target.id, role.id)
 
         log_embed = disnake.Embed(title="🔓 Разбан", color=0x2ecc71)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -861,8 +854,8 @@ class WarnModal(disnake.ui.Modal):
             return
 
         await inter.response.defer(ephemeral=True)
-        await self.target.add_roles(role, reason=reason)
-        add_punishment(self.target.id, warn_type, role.id, None, reason)
+        await rest.edit_roles(self.target, add=[role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, warn_type, role.id, None, reason)
 
         log_embed = disnake.Embed(title="⚠️ Предупреждение", color=0xf39c12)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -888,8 +881,7 @@ class UnwarnModal(disnake.ui.Modal):
 
     async def callback(self, inter: disnake.ModalInteraction):
         reason = inter.text_values["reason"]
-        data = load_punishments()
-        user_data = data.get(str(self.target.id), [])
+        user_data = get_user_punishments(self.target.guild.id, self.target.id)
         warn_p = next((p for p in user_data if p["type"] in ["support_warn", "moderator_warn"]), None)
         if not warn_p:
             await inter.response.send_message("❌ У пользователя нет активных предупреждений.", ephemeral=True)
@@ -898,8 +890,8 @@ class UnwarnModal(disnake.ui.Modal):
         role = inter.guild.get_role(warn_p["role_id"])
         if role in self.target.roles:
             await inter.response.defer(ephemeral=True)
-            await self.target.remove_roles(role, reason=reason)
-            remove_punishment(self.target.id, role.id)
+            await rest.edit_roles(self.target, remove=[role], reason=reason)
+            remove_punishment(self.target.guild.id, self.target.id, role.id)
 
             log_embed = disnake.Embed(title="✅ Снятие предупреждения", color=0x2ecc71)
             log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -937,8 +929,8 @@ class RemarkModal(disnake.ui.Modal):
             return
 
         await inter.response.defer(ephemeral=True)
-        await self.target.add_roles(role, reason=reason)
-        add_punishment(self.target.id, "remark", role.id, None, reason)
+        await rest.edit_roles(self.target, add=[role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, "remark", role.id, None, reason)
 
         log_embed = disnake.Embed(title="📝 Замечание", color=0xe67e22)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -974,8 +966,8 @@ class UnremarkModal(disnake.ui.Modal):
             return
 
         await inter.response.defer(ephemeral=True)
-        await self.target.remove_roles(role, reason=reason)
-        remove_punishment(self.target.id, role.id)
+        await rest.edit_roles(self.target, remove=[role], reason=reason)
+        remove_punishment(self.target.guild.id, self.target.id, role.id)
 
         log_embed = disnake.Embed(title="✅ Снятие замечания", color=0x2ecc71)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1024,8 +1016,8 @@ class MuteModal(disnake.ui.Modal):
             return
 
         await inter.response.defer(ephemeral=True)
-        await self.target.add_roles(role, reason=reason)
-        add_punishment(self.target.id, f"mute_{self.mute_type}", role.id, end_time, reason)
+        await rest.edit_roles(self.target, add=[role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, f"mute_{self.mute_type}", role.id, end_time, reason)
 
         type_label = "Текстовый" if self.mute_type == "text" else "Голосовой"
         log_embed = disnake.Embed(title=f"🔇 {type_label} мут", color=0x95a5a6)
@@ -1054,8 +1046,7 @@ class UnmuteModal(disnake.ui.Modal):
 
     async def callback(self, inter: disnake.ModalInteraction):
         reason = inter.text_values["reason"]
-        data = load_punishments()
-        user_data = data.get(str(self.target.id), [])
+        user_data = get_user_punishments(self.target.guild.id, self.target.id)
         mute_p = next((p for p in user_data if p["type"].startswith("mute_")), None)
         if not mute_p:
             await inter.response.send_message("❌ У пользователя нет активного мута.", ephemeral=True)
@@ -1064,8 +1055,8 @@ class UnmuteModal(disnake.ui.Modal):
         role = inter.guild.get_role(mute_p["role_id"])
         if role in self.target.roles:
             await inter.response.defer(ephemeral=True)
-            await self.target.remove_roles(role, reason=reason)
-            remove_punishment(self.target.id, role.id)
+            await rest.edit_roles(self.target, remove=[role], reason=reason)
+            remove_punishment(self.target.guild.id, self.target.id, role.id)
 
             log_embed = disnake.Embed(title="✅ Снятие мута", color=0x2ecc71)
             log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1107,9 +1098,8 @@ class NedopuskModal(disnake.ui.Modal):
             return
 
         await inter.response.defer(ephemeral=True)
-        await self.target.remove_roles(unverified_role, reason=reason)
-        await self.target.add_roles(nedopusk_role, reason=reason)
-        add_punishment(self.target.id, "nedopusk", nedopusk_role.id, None, reason)
+        await rest.edit_roles(self.target, add=[nedopusk_role], remove=[unverified_role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, "nedopusk", nedopusk_role.id, None, reason)
 
         log_embed = disnake.Embed(title="🚫 Недопуск", color=0x2c3e50)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1149,8 +1139,8 @@ class UnNedopuskModal(disnake.ui.Modal):
             return
 
         await inter.response.defer(ephemeral=True)
-        await self.target.remove_roles(nedopusk_role, reason=reason)
-        remove_punishment(self.target.id, nedopusk_role.id)
+        await rest.edit_roles(self.target, remove=[nedopusk_role], reason=reason)
+        remove_punishment(self.target.guild.id, self.target.id, nedopusk_role.id)
 
         log_embed = disnake.Embed(title="✅ Снятие недопуска", color=0x2ecc71)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1195,8 +1185,9 @@ class SuspensionModal(disnake.ui.Modal):
             await inter.response.send_message("❌ У пользователя уже есть активное отстранение.", ephemeral=True)
             return
 
-        await self.target.add_roles(role, reason=reason)
-        add_punishment(self.target.id, "suspension", role.id, end_time, reason)
+        await inter.response.defer(ephemeral=True)
+        await rest.edit_roles(self.target, add=[role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, "suspension", role.id, end_time, reason)
 
         log_embed = disnake.Embed(title="⏳ Отстранение", color=0x8e44ad)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1207,7 +1198,7 @@ class SuspensionModal(disnake.ui.Modal):
 
         dm_embed = make_punishment_dm(inter.guild, "⏳ Вам выдано отстранение", 0x8e44ad, inter.author, reason, end_time)
         await self.cog._dm_user(self.target, dm_embed)
-        await inter.response.send_message(f"✅ Отстранение выдано {self.target.mention}.", ephemeral=True)
+        await inter.edit_original_response(content=f"✅ Отстранение выдано {self.target.mention}.")
 
 
 class UnsuspensionModal(disnake.ui.Modal):
@@ -1232,8 +1223,9 @@ class UnsuspensionModal(disnake.ui.Modal):
             await inter.response.send_message("❌ У пользователя нет активного отстранения.", ephemeral=True)
             return
 
-        await self.target.remove_roles(role, reason=reason)
-        remove_punishment(self.target.id, role.id)
+        await inter.response.defer(ephemeral=True)
+        await rest.edit_roles(self.target, remove=[role], reason=reason)
+        remove_punishment(self.target.guild.id, self.target.id, role.id)
 
         log_embed = disnake.Embed(title="✅ Снятие отстранения", color=0x2ecc71)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1243,7 +1235,7 @@ class UnsuspensionModal(disnake.ui.Modal):
 
         dm_embed = make_removal_dm(inter.guild, "✅ Ваше отстранение снято", 0x2ecc71, inter.author, reason)
         await self.cog._dm_user(self.target, dm_embed)
-        await inter.response.send_message(f"✅ Отстранение снято с {self.target.mention}.", ephemeral=True)
+        await inter.edit_original_response(content=f"✅ Отстранение снято с {self.target.mention}.")
 
 
 class ReprimandModal(disnake.ui.Modal):
@@ -1279,8 +1271,9 @@ class ReprimandModal(disnake.ui.Modal):
             await inter.response.send_message("❌ У пользователя уже есть выговор по этой ветке.", ephemeral=True)
             return
 
-        await self.target.add_roles(role, reason=reason)
-        add_punishment(self.target.id, f"reprimand_{self.branch}", role.id, end_time, reason)
+        await inter.response.defer(ephemeral=True)
+        await rest.edit_roles(self.target, add=[role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, f"reprimand_{self.branch}", role.id, end_time, reason)
 
         log_embed = disnake.Embed(title=f"📢 Выговор ({self.branch})", color=0xd35400)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1291,7 +1284,7 @@ class ReprimandModal(disnake.ui.Modal):
 
         dm_embed = make_punishment_dm(inter.guild, f"📢 Вам выдан выговор ({self.branch})", 0xd35400, inter.author, reason, end_time)
         await self.cog._dm_user(self.target, dm_embed)
-        await inter.response.send_message(f"✅ Выговор ({self.branch}) выдан {self.target.mention}.", ephemeral=True)
+        await inter.edit_original_response(content=f"✅ Выговор ({self.branch}) выдан {self.target.mention}.")
 
 
 class UnreprimandModal(disnake.ui.Modal):
@@ -1307,8 +1300,7 @@ class UnreprimandModal(disnake.ui.Modal):
 
     async def callback(self, inter: disnake.ModalInteraction):
         reason = inter.text_values["reason"]
-        data = load_punishments()
-        user_data = data.get(str(self.target.id), [])
+        user_data = get_user_punishments(self.target.guild.id, self.target.id)
         reprimand_p = next((p for p in user_data if p["type"].startswith("reprimand_")), None)
         if not reprimand_p:
             await inter.response.send_message("❌ У пользователя нет активных выговоров.", ephemeral=True)
@@ -1316,8 +1308,9 @@ class UnreprimandModal(disnake.ui.Modal):
 
         role = inter.guild.get_role(reprimand_p["role_id"])
         if role in self.target.roles:
-            await self.target.remove_roles(role, reason=reason)
-            remove_punishment(self.target.id, role.id)
+            await inter.response.defer(ephemeral=True)
+            await rest.edit_roles(self.target, remove=[role], reason=reason)
+            remove_punishment(self.target.guild.id, self.target.id, role.id)
 
             log_embed = disnake.Embed(title="✅ Снятие выговора", color=0x2ecc71)
             log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1327,7 +1320,7 @@ class UnreprimandModal(disnake.ui.Modal):
 
             dm_embed = make_removal_dm(inter.guild, "✅ Ваш выговор снят", 0x2ecc71, inter.author, reason)
             await self.cog._dm_user(self.target, dm_embed)
-            await inter.response.send_message(f"✅ Выговор снят с {self.target.mention}.", ephemeral=True)
+            await inter.edit_original_response(content=f"✅ Выговор снят с {self.target.mention}.")
         else:
             await inter.response.send_message("❌ Роль выговора не найдена.", ephemeral=True)
 
@@ -1355,8 +1348,9 @@ class CHSModal(disnake.ui.Modal):
             await inter.response.send_message("❌ У пользователя уже есть ЧС по этой ветке.", ephemeral=True)
             return
 
-        await self.target.add_roles(role, reason=reason)
-        add_punishment(self.target.id, f"chs_{self.branch}", role.id, None, reason)
+        await inter.response.defer(ephemeral=True)
+        await rest.edit_roles(self.target, add=[role], reason=reason)
+        add_punishment(self.target.guild.id, self.target.id, f"chs_{self.branch}", role.id, None, reason)
 
         log_embed = disnake.Embed(title=f"⛔ ЧС состава ({self.branch})", color=0xc0392b)
         log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1366,7 +1360,7 @@ class CHSModal(disnake.ui.Modal):
 
         dm_embed = make_punishment_dm(inter.guild, f"⛔ Вы добавлены в ЧС состава ({self.branch})", 0xc0392b, inter.author, reason)
         await self.cog._dm_user(self.target, dm_embed)
-        await inter.response.send_message(f"✅ ЧС ({self.branch}) выдано {self.target.mention}.", ephemeral=True)
+        await inter.edit_original_response(content=f"✅ ЧС ({self.branch}) выдано {self.target.mention}.")
 
 
 class UnCHSModal(disnake.ui.Modal):
@@ -1382,8 +1376,7 @@ class UnCHSModal(disnake.ui.Modal):
 
     async def callback(self, inter: disnake.ModalInteraction):
         reason = inter.text_values["reason"]
-        data = load_punishments()
-        user_data = data.get(str(self.target.id), [])
+        user_data = get_user_punishments(self.target.guild.id, self.target.id)
         chs_p = next((p for p in user_data if p["type"].startswith("chs_")), None)
         if not chs_p:
             await inter.response.send_message("❌ У пользователя нет активного ЧС.", ephemeral=True)
@@ -1391,8 +1384,9 @@ class UnCHSModal(disnake.ui.Modal):
 
         role = inter.guild.get_role(chs_p["role_id"])
         if role in self.target.roles:
-            await self.target.remove_roles(role, reason=reason)
-            remove_punishment(self.target.id, role.id)
+            await inter.response.defer(ephemeral=True)
+            await rest.edit_roles(self.target, remove=[role], reason=reason)
+            remove_punishment(self.target.guild.id, self.target.id, role.id)
 
             log_embed = disnake.Embed(title="✅ Снятие ЧС", color=0x2ecc71)
             log_embed.add_field(name="Исполнитель", value=inter.author.mention)
@@ -1402,7 +1396,7 @@ class UnCHSModal(disnake.ui.Modal):
 
             dm_embed = make_removal_dm(inter.guild, "✅ Вы убраны из ЧС состава", 0x2ecc71, inter.author, reason)
             await self.cog._dm_user(self.target, dm_embed)
-            await inter.response.send_message(f"✅ ЧС снято с {self.target.mention}.", ephemeral=True)
+            await inter.edit_original_response(content=f"✅ ЧС снято с {self.target.mention}.")
         else:
             await inter.response.send_message("❌ Роль ЧС не найдена.", ephemeral=True)
 
@@ -2,51 +2,43 @@
 import disnake
 from disnake.ext import commands
 import json
-import os
 import datetime
 from utils.checks import has_role
-from utils.helpers import load_punishments, remove_punishment
+from utils.helpers import get_user_punishments, remove_punishment
+from utils.logger import log_action
+from utils.dm import dms
+from utils.rest_queue import INTERACTION, channel_route, rest
+from utils.storage import json_file
 
-APPEALS_FILE = "data/appeals.json"
+APPEALS_FILE = json_file("data/appeals.json", default=lambda: {"counter": 0, "cooldowns": {}})
 
 
-def load_appeals():
-    try:
-        with open(APPEALS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"counter": 0, "cooldowns": {}}
+async def load_appeals():
+    return await APPEALS_FILE.load()
 
 
-def save_appeals(data):
-    os.makedirs("data", exist_ok=True)
-    with open(APPEALS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+async def next_appeal_number():
+    # Счётчик увеличивается под блокировкой файла, поэтому номера не повторяются
+    async with APPEALS_FILE.transaction() as data:
+        data["counter"] = data.get("counter", 0) + 1
+        if "cooldowns" not in data:
+            data["cooldowns"] = {}
+        return data["counter"]
 
 
-def next_appeal_number():
-    data = load_appeals()
-    data["counter"] = data.get("counter", 0) + 1
-    if "cooldowns" not in data:
-        data["cooldowns"] = {}
-    save_appeals(data)
-    return data["counter"]
+async def set_cooldown(user_id, appeal_type):
+    async with APPEALS_FILE.transaction() as data:
+        if "cooldowns" not in data:
+            data["cooldowns"] = {}
+        user_id = str(user_id)
+        if user_id not in data["cooldowns"]:
+            data["cooldowns"][user_id] = {}
+        expire = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=7)).timestamp()
+        data["cooldowns"][user_id][appeal_type] = expire
 
 
-def set_cooldown(user_id, appeal_type):
-    data = load_appeals()
-    if "cooldowns" not in data:
-        data["cooldowns"] = {}
-    user_id = str(user_id)
-    if user_id not in data["cooldowns"]:
-        data["cooldowns"][user_id] = {}
-    expire = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=7)).timestamp()
-    data["cooldowns"][user_id][appeal_type] = expire
-    save_appeals(data)
-
-
-def get_cooldown(user_id, appeal_type):
-    data = load_appeals()
+async def get_cooldown(user_id, appeal_type):
+    data = await load_appeals()
     user_id = str(user_id)
     cd = data.get("cooldowns", {}).get(user_id, {}).get(appeal_type)
     if cd is None:
@@ -54,22 +46,21 @@ def get_cooldown(user_id, appeal_type):
     now = datetime.datetime.now(datetime.timezone.utc).timestamp()
     if now >= cd:
         # cooldown expired, clean up
-        data["cooldowns"][user_id].pop(appeal_type, None)
-        if not data["cooldowns"][user_id]:
-            data["cooldowns"].pop(user_id, None)
-        save_appeals(data)
+        async with APPEALS_FILE.transaction() as data:
+            cooldowns = data.get("cooldowns", {})
+            if cooldowns.get(user_id, {}).get(appeal_type) == cd:
+                cooldowns[user_id].pop(appeal_type, None)
+                if not cooldowns[user_id]:
+                    cooldowns.pop(user_id, None)
         return None
     return cd
 
 
-def _find_punishment(user_id, role_id):
+def _find_punishment(guild_id, user_id, role_id):
     """Find punishment data for a user by role_id."""
-    punishments = load_punishments()
-    user_id = str(user_id)
-    if user_id in punishments:
-        for p in punishments[user_id]:
-            if p["role_id"] == role_id:
-                return p
+    for p in get_user_punishments(guild_id, user_id):
+        if p["role_id"] == role_id:
+            return p
     return None
 
 
@@ -123,7 +114,7 @@ class AppealButtonView(disnake.ui.View):
             return
 
         # Check cooldown
-        cd = get_cooldown(inter.author.id, appeal_type)
+        cd = await get_cooldown(inter.author.id, appeal_type)
         if cd is not None:
             await inter.response.send_message(
                 f"❌ Вы уже подавали апелляцию. Повторная подача доступна <t:{int(cd)}:R>.",
@@ -180,10 +171,10 @@ class AppealSubmitModal(disnake.ui.Modal):
         role_id = roles.get(self.appeal_type)
 
         # Get punishment data
-        punishment = _find_punishment(inter.author.id, role_id)
+        punishment = _find_punishment(inter.guild.id, inter.author.id, role_id)
 
         # Generate appeal number
-        appeal_num = next_appeal_number()
+        appeal_num = await next_appeal_number()
 
         # Determine target channel
         if self.appeal_type == "nedopusk":
@@ -304,11 +295,11 @@ class AppealSubmitModal(disnake.ui.Modal):
 
         # Buttons for admins
         view = AppealDecisionView(user.id, self.appeal_type, appeal_num)
-        await channel.send(content=ping_content, embed=embed, view=view)
+        await inter.response.defer(ephemeral=True)
+        await rest.send(channel, priority=INTERACTION, content=ping_content, embed=embed, view=view)
 
-        await inter.response.send_message(
-            f"✅ Ваша апелляция №{appeal_num} отправлена на рассмотрение.",
-            ephemeral=True,
+        await inter.edit_original_response(
+            content=f"✅ Ваша апелляция №{appeal_num} отправлена на рассмотрение.",
         )
 
 
@@ -421,6 +412,8 @@ class AppealReasonModal(disnake.ui.Modal):
             await inter.response.send_message("❌ Ошибка системы.", ephemeral=True)
             return
 
+        # Роли и сообщение апелляции меняются через общую очередь — отвечаем после неё
+        await inter.response.defer(ephemeral=True)
         reason = inter.text_values["reason"]
         config = cog.config
         roles = config.get("roles", {})
@@ -431,12 +424,14 @@ class AppealReasonModal(disnake.ui.Modal):
         if self.action == "approve":
             # === APPROVE ===
             if target:
+                # Снятие роли и выдача unverified уходят одним изменением участника
+                add, remove = [], []
                 role_id = roles.get(self.appeal_type)
                 if role_id:
                     role = self.guild.get_role(role_id)
                     if role and role in target.roles:
-                        await target.remove_roles(role, reason=f"Апелляция №{self.appeal_num} одобрена")
-                    remove_punishment(self.target_id, role_id)
+                        remove.append(role)
+                    remove_punishment(self.guild.id, self.target_id, role_id)
 
                 # For nedopusk: give unverified role
                 if self.appeal_type == "nedopusk":
@@ -444,43 +439,56 @@ class AppealReasonModal(disnake.ui.Modal):
                     if unverified_id:
                         unverified_role = self.guild.get_role(unverified_id)
                         if unverified_role:
-                            await target.add_roles(unverified_role, reason=f"Апелляция №{self.appeal_num} одобрена")
+                            add.append(unverified_role)
+
+                if add or remove:
+                    await rest.edit_roles(target, add=add, remove=remove, reason=f"Апелляция №{self.appeal_num} одобрена")
 
                 # DM user
-                try:
-                    await target.send(
+                dms.send(
+                    target,
+                    content=(
                         f"✅ **Ваша апелляция {type_name} №{self.appeal_num} одобрена.**\n"
                         f"**Причина:** {reason}\n"
                         f"**Рассмотрел:** {self.admin.display_name}"
-                    )
-                except:
-                    pass
+                    ),
+                )
 
             # Update embed
             await self._update_embed(inter, "✅ Одобрено", disnake.Color.green(), reason)
+            await self._send_log(config, "✅ Апелляция одобрена", 0x2ecc71, type_name, reason)
 
         else:
             # === REJECT ===
-            set_cooldown(self.target_id, self.appeal_type)
+            await set_cooldown(self.target_id, self.appeal_type)
 
             if target:
-                try:
-                    await target.send(
+                dms.send(
+                    target,
+                    content=(
                         f"❌ **Ваша апелляция {type_name} №{self.appeal_num} отклонена.**\n"
                         f"**Причина:** {reason}\n"
                         f"**Рассмотрел:** {self.admin.display_name}\n"
                         f"Повторная подача апелляции доступна через **7 дней**."
-                    )
-                except:
-                    pass
+                    ),
+                )
 
             await self._update_embed(inter, "❌ Отклонено", disnake.Color.dark_grey(), reason)
+            await self._send_log(config, "❌ Апелляция отклонена", 0x95a5a6, type_name, reason)
+
+    async def _send_log(self, config, title, color, type_name, reason):
+        embed = disnake.Embed(title=title, color=color)
+        embed.add_field(name="Апелляция", value=f"№{self.appeal_num} ({type_name})")
+        embed.add_field(name="Рассмотрел", value=self.admin.mention)
+        embed.add_field(name="Пользователь", value=f"<@{self.target_id}>")
+        embed.add_field(name="Причина", value=reason, inline=False)
+        await log_action(self.guild, config["log_channel"], embed)
 
     async def _update_embed(self, inter, status_text, color, reason):
         """Update the original appeal embed with the decision."""
         msg = self.original_message
         if not msg:
-            await inter.response.send_message(f"{status_text} — апелляция обработана.", ephemeral=True)
+            await inter.edit_original_response(content=f"{status_text} — апелляция обработана.")
             return
 
         old_embed = msg.embeds[0] if msg.embeds else None
@@ -516,8 +524,10 @@ class AppealReasonModal(disnake.ui.Modal):
             label="Отклонить", style=disnake.ButtonStyle.danger, disabled=True, custom_id="disabled_reject"
         ))
 
-        await msg.edit(embed=new_embed, view=disabled_view)
-        await inter.response.send_message(f"{status_text} — апелляция №{self.appeal_num} обработана.", ephemeral=True)
+        await rest.submit(
+            channel_route(msg.channel), lambda: msg.edit(embed=new_embed, view=disabled_view), INTERACTION
+        )
+        await inter.edit_original_response(content=f"{status_text} — апелляция №{self.appeal_num} обработана.")
 
 
 # ========== Cog ==========
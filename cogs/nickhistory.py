@@ -1,42 +1,33 @@
 import disnake
 from disnake.ext import commands
-import json
 import datetime
+from utils.storage import json_file
 
 class NickHistory(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.file = "data/nicknames.json"
+        self.file = json_file("data/nicknames.json", ensure_ascii=True)
 
-    def load_data(self):
-        try:
-            with open(self.file, "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-
-    def save_data(self, data):
-        with open(self.file, "w") as f:
-            json.dump(data, f, indent=4)
+    async def load_data(self):
+        return await self.file.load()
 
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
         if before.display_name != after.display_name:
-            data = self.load_data()
-            user_id = str(after.id)
-            if user_id not in data:
-                data[user_id] = []
-            data[user_id].append({
-                "nickname": after.display_name,
-                "timestamp": datetime.datetime.utcnow().timestamp()
-            })
-            self.save_data(data)
+            async with self.file.transaction() as data:
+                user_id = str(after.id)
+                if user_id not in data:
+                    data[user_id] = []
+                data[user_id].append({
+                    "nickname": after.display_name,
+                    "timestamp": datetime.datetime.utcnow().timestamp()
+                })
 
     @commands.slash_command(name="history_nick", description="История никнеймов пользователя")
     async def history_nick(self, inter, user: disnake.Member = None):
         if not user:
             user = inter.author
-        data = self.load_data()
+        data = await self.load_data()
         entries = data.get(str(user.id), [])
         if not entries:
             await inter.response.send_message("История никнеймов пуста.", ephemeral=True)
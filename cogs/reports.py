@@ -2,21 +2,13 @@ import disnake
 from disnake.ext import commands
 import json
 import datetime
-import os
+from utils.storage import json_file
 
-
-def load_reports():
-    try:
-        with open("data/reports.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"count": 0, "reports": {}}
+REPORTS_FILE = json_file("data/reports.json", default=lambda: {"count": 0, "reports": {}})
 
 
-def save_reports(data):
-    os.makedirs("data", exist_ok=True)
-    with open("data/reports.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+async def load_reports():
+    return await REPORTS_FILE.load()
 
 
 class Reports(commands.Cog):
@@ -50,9 +42,16 @@ class Reports(commands.Cog):
 
         await inter.response.defer(ephemeral=True)
 
-        reports_data = load_reports()
-        reports_data["count"] += 1
-        report_num = reports_data["count"]
+        # Номер выдаётся и запись сохраняется под блокировкой файла — без дублей
+        async with REPORTS_FILE.transaction() as reports_data:
+            reports_data["count"] += 1
+            report_num = reports_data["count"]
+            reports_data["reports"][str(report_num)] = {
+                "reporter_id": inter.author.id,
+                "target_id": user.id,
+                "reason": reason,
+                "status": "pending"
+            }
 
         embed = disnake.Embed(
             title=f"Жалоба #{report_num} — {user.display_name}",
@@ -78,14 +77,6 @@ class Reports(commands.Cog):
         embed.add_field(name="Причина", value=reason, inline=False)
         embed.set_footer(text=f"Репорт #{report_num}")
 
-        reports_data["reports"][str(report_num)] = {
-            "reporter_id": inter.author.id,
-            "target_id": user.id,
-            "reason": reason,
-            "status": "pending"
-        }
-        save_reports(reports_data)
-
         view = ReportView(report_num)
         await channel.send(embed=embed, view=view)
 
@@ -145,19 +136,17 @@ class ReportActionModal(disnake.ui.Modal):
     async def callback(self, inter: disnake.ModalInteraction):
         note = inter.text_values.get("note", "").strip()
 
-        data = load_reports()
-        report_info = data["reports"].get(str(self.report_num), {})
-
-        if self.action == "accept":
-            data["reports"][str(self.report_num)]["status"] = "accepted"
-            status_label = "✅ Принята"
-            color = 0x2ecc71
-        else:
-            data["reports"][str(self.report_num)]["status"] = "rejected"
-            status_label = "❌ Отклонена"
-            color = 0x95a5a6
-
-        save_reports(data)
+        async with REPORTS_FILE.transaction() as data:
+            report_info = data["reports"].get(str(self.report_num), {})
+
+            if self.action == "accept":
+                data["reports"][str(self.report_num)]["status"] = "accepted"
+                status_label = "✅ Принята"
+                color = 0x2ecc71
+            else:
+                data["reports"][str(self.report_num)]["status"] = "rejected"
+                status_label = "❌ Отклонена"
+                color = 0x95a5a6
 
         # Edit the original embed
         if inter.message.embeds:
@@ -1,3 +1,4 @@
+import asyncio
 import disnake
 from disnake.ext import commands
 import json
@@ -5,6 +6,7 @@ import datetime
 import re
 from utils.checks import has_role
 from utils.logger import log_action
+from utils.rest_queue import rest
 
 class StaffControl(commands.Cog):
     def __init__(self, bot):
@@ -249,11 +251,13 @@ class StaffReasonModal(disnake.ui.Modal):
         action_word = "Выдача" if self.action == "promote" else "Снятие"
         audit_reason = f"{action_word} через /staff {self.action} | {reason} | {self.author}"
 
-        for member in self.members:
-            if self.action == "promote":
-                await member.add_roles(self.role, reason=audit_reason)
-            else:
-                await member.remove_roles(self.role, reason=audit_reason)
+        # Массовая выдача может занять дольше трёх секунд — отвечаем после очереди
+        await inter.response.defer(ephemeral=True)
+        if self.action == "promote":
+            changes = [rest.edit_roles(member, add=[self.role], reason=audit_reason) for member in self.members]
+        else:
+            changes = [rest.edit_roles(member, remove=[self.role], reason=audit_reason) for member in self.members]
+        await asyncio.gather(*changes)
 
         # Отправляем лог используя сохранённые guild и author
         await self._send_log(reason)
@@ -267,7 +271,7 @@ class StaffReasonModal(disnake.ui.Modal):
                 msg += f"\n⚠️ Уже имеют роль: {', '.join(self.no_role)}"
             else:
                 msg += f"\n⚠️ Не имеют роли: {', '.join(self.no_role)}"
-        await inter.response.send_message(msg, ephemeral=True)
+        await inter.edit_original_response(content=msg)
 
     async def _send_log(self, reason):
         if self.action == "demote":
@@ -275,10 +279,6 @@ class StaffReasonModal(disnake.ui.Modal):
         else:
             channel_id = self.cog.config["log_channel"]
 
-        channel = self.guild.get_channel(channel_id)
-        if not channel:
-            return
-
         title = "Выдача стафф роли" if self.action == "promote" else "Снятие со стафф роли"
         color = disnake.Color.green() if self.action == "promote" else disnake.Color.red()
 
@@ -301,7 +301,7 @@ class StaffReasonModal(disnake.ui.Modal):
             color=color,
             timestamp=datetime.datetime.now(datetime.timezone.utc)
         )
-        await channel.send(embed=embed)
+        await log_action(self.guild, channel_id, embed)
 
 
 def setup(bot):
@@ -1,10 +1,15 @@
 import disnake
-from disnake.ext import commands
+from disnake.ext import commands, tasks
 import json
+import os
+import tempfile
 import time
 import datetime
-import os
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from utils.guild_stores import GuildStores, resolve_home
+from utils.storage import on_shutdown, run_io
+from utils.voice_export import FIELDS, ExportWriter, user_rows
+from utils.voice_store import ActiveJournal, VoiceStore, month_period, week_period
 
 
 DAYS_RU = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
@@ -24,6 +29,60 @@ PUNISHMENT_TYPE_NAMES = {
     "reprimand_admin": "Выговор",
 }
 
+STAFF_GROUPS = [
+    ("owner", "Owner"), ("developer", "Developer"), ("admin", "Admin"),
+    ("moderator", "Moderator"), ("support", "Support"),
+    ("eventsmod", "Events"), ("creative", "Creative"),
+    ("clanmaster", "Clan"), ("closemaker", "Close"), ("broadcaster", "Broadcast"),
+]
+
+# Сколько отрисованных страниц VoiceView держать в памяти
+VIEW_CACHE_SIZE = 256
+
+TOP_PERIODS = {
+    "Эта неделя": "week",
+    "Прошлая неделя": "prev_week",
+    "Этот месяц": "month",
+    "Прошлый месяц": "prev_month",
+}
+
+
+class TrackingScope:
+    """Какие голосовые каналы и участники учитываются трекером (config: voice_tracking).
+
+    Категории и каналы задаются ID; строка в списке категорий — ключ из
+    voice_zones. Пустые include_* означают «все каналы».
+    """
+
+    def __init__(self, config):
+        settings = config.get("voice_tracking", {})
+        zones = config.get("voice_zones", {})
+
+        def ids(key):
+            return frozenset(zones.get(x) if isinstance(x, str) else x for x in settings.get(key, [])) - {None}
+
+        self.include_categories = ids("include_categories")
+        self.exclude_categories = ids("exclude_categories")
+        self.include_channels = ids("include_channels")
+        self.exclude_channels = ids("exclude_channels")
+        self.track_afk = settings.get("track_afk", False)
+        self.track_bots = settings.get("track_bots", False)
+        self.min_session = settings.get("min_session_seconds", 10)
+
+    def tracks_member(self, member):
+        return self.track_bots or not member.bot
+
+    def tracks_channel(self, channel):
+        if channel is None:
+            return False
+        if not self.track_afk and channel == channel.guild.afk_channel:
+            return False
+        if channel.id in self.exclude_channels or channel.category_id in self.exclude_categories:
+            return False
+        if self.include_channels or self.include_categories:
+            return channel.id in self.include_channels or channel.category_id in self.include_categories
+        return True
+
 
 def format_duration(seconds):
     seconds = int(seconds)
@@ -45,31 +104,115 @@ def format_duration(seconds):
 class Voice(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.active = {}  # {user_id: {start, channel_id, channel_name}}
-        self.data_file = "data/voice.json"
+        self.active = {}  # {(guild_id, user_id): {start, channel_id, channel_name}}
+        # Голосовая активность каждого сервера — в своём каталоге данных
+        self.stores = GuildStores(lambda directory: VoiceStore(
+            os.path.join(directory, "voice.bin"), legacy_json=os.path.join(directory, "voice.json")
+        ))
+        self.journal = ActiveJournal("data/voice_active.jsonl")
+        self._restored_until = None  # последняя отметка журнала до перезапуска
+        self.scope = TrackingScope(self._get_config())
+        self._view_cache = OrderedDict()  # {(guild, user, week_offset, day, version, ...): (embed, active_days)}
+        on_shutdown(self._save_on_shutdown)
+
+    async def cog_load(self):
+        self.active, self._restored_until = await run_io(self.journal.load)
+        self.flush_loop.start()
+        self.compact_loop.start()
+
+    def cog_unload(self):
+        self.flush_loop.cancel()
+        self.compact_loop.cancel()
+        self._save_on_shutdown()
+
+    def _save_on_shutdown(self):
+        # Открытые сессии остаются в журнале и продолжатся после перезапуска
+        for store in self.stores.values():
+            store.flush_sync()
+        self.journal.checkpoint(self.active, time.time())
+
+    @tasks.loop(seconds=60)
+    async def flush_loop(self):
+        # Пакетная запись: все изменения за минуту уходят на диск одним сохранением
+        for store in self.stores.values():
+            await store.flush()
+        self.journal.alive(self.active, time.time())
+        # Заодно подхватываем изменения voice_tracking без перезапуска
+        self.scope = TrackingScope(self._get_config())
+
+    @tasks.loop(hours=6)
+    async def compact_loop(self):
+        # Сессии старше срока хранения сворачиваются в дневные суммы по каналам
+        weeks = self._get_config().get("voice_retention_weeks", 8)
+        if not weeks:
+            return
+        cutoff = datetime.datetime.utcnow().date() - datetime.timedelta(weeks=weeks)
+        for guild in self.bot.guilds:
+            store = await self._store(guild.id)
+            moved = store.compact(cutoff)
+            if moved:
+                print(f"[Voice] {guild.name}: свёрнуто сессий старше {cutoff.isoformat()}: {moved}")
+                await store.flush()
+
+    @compact_loop.before_loop
+    async def before_compact(self):
+        # Хранилища создаются по серверам, а их список известен только после on_ready
+        await self.bot.wait_until_ready()
+
+    async def _store(self, guild_id):
+        store = self.stores.get(guild_id)
+        await store.ensure_loaded()
+        return store
+
+    def _start_session(self, key, channel, now):
+        sess = {"start": now, "channel_id": channel.id, "channel_name": channel.name}
+        self.active[key] = sess
+        self.journal.open(key, sess)
+
+    async def _end_session(self, key, now):
+        sess = self.active.pop(key, None)
+        if sess is None:
+            return
+        self.journal.close(key)
+        if now - sess["start"] >= self.scope.min_session:
+            guild_id, user_id = key
+            store = await self._store(guild_id)
+            store.add_session(user_id, sess["start"], now, sess["channel_id"], sess["channel_name"])
 
-    def load_data(self):
-        try:
-            with open(self.data_file, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-                if not isinstance(raw, dict):
-                    return {}
-                result = {}
-                for uid, udata in raw.items():
-                    if isinstance(udata, dict) and "sessions" in udata:
-                        result[uid] = udata
-                    elif isinstance(udata, dict):
-                        # migrate old format: {"verification": X, "mod": Y}
-                        total = udata.get("verification", 0) + udata.get("mod", 0)
-                        result[uid] = {"sessions": [], "total": float(total), "last_seen": 0.0}
-                return result
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-
-    def save_data(self, data):
-        os.makedirs("data", exist_ok=True)
-        with open(self.data_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Сверка с фактическим составом голосовых каналов за один проход:
+        # после перезапуска продолжаем сессии из журнала, новых участников
+        # начинаем отслеживать сразу, а ушедших закрываем
+        now = time.time()
+        ended_at = self._restored_until or now
+        self._restored_until = None
+
+        # Сессии из журнала до разделения по серверам принадлежат исходному серверу;
+        # если он не найден, отнести их некуда
+        home = resolve_home(self.bot.guilds)
+        self.active = {
+            (guild_id or home, user_id): sess for (guild_id, user_id), sess in self.active.items()
+            if guild_id or home
+        }
+
+        present = {}
+        for guild in self.bot.guilds:
+            for channel in guild.voice_channels + guild.stage_channels:
+                if not self.scope.tracks_channel(channel):
+                    continue
+                for member in channel.members:
+                    if self.scope.tracks_member(member):
+                        present[(guild.id, str(member.id))] = channel
+
+        for key, sess in list(self.active.items()):
+            channel = present.get(key)
+            if channel is None or channel.id != sess["channel_id"]:
+                await self._end_session(key, max(ended_at, sess["start"]))
+        for key, channel in present.items():
+            if key not in self.active:
+                self._start_session(key, channel, now)
+        self.journal.checkpoint(self.active, now)
 
     def _get_config(self):
         with open("config.json", encoding="utf-8") as f:
@@ -77,14 +220,8 @@ class Voice(commands.Cog):
 
     def _get_user_group(self, member, config):
         role_ids = config.get("roles", {})
-        priority = [
-            ("owner", "Owner"), ("developer", "Developer"), ("admin", "Admin"),
-            ("moderator", "Moderator"), ("support", "Support"),
-            ("eventsmod", "Events"), ("creative", "Creative"),
-            ("clanmaster", "Clan"), ("closemaker", "Close"), ("broadcaster", "Broadcast"),
-        ]
         member_role_ids = {r.id for r in member.roles}
-        for key, label in priority:
+        for key, label in STAFF_GROUPS:
             rid = role_ids.get(key)
             if rid and rid in member_role_ids:
                 return label
@@ -96,64 +233,43 @@ class Voice(commands.Cog):
         sunday = monday + datetime.timedelta(days=6)
         return monday, sunday
 
-    def _get_sessions_in_range(self, sessions, start_date, end_date):
-        start_ts = datetime.datetime.combine(
-            start_date, datetime.time.min, tzinfo=datetime.timezone.utc
-        ).timestamp()
-        end_ts = datetime.datetime.combine(
-            end_date, datetime.time.max, tzinfo=datetime.timezone.utc
-        ).timestamp()
-        return [s for s in sessions if start_ts <= s.get("start", 0) <= end_ts]
-
-    def _sessions_total(self, sessions):
-        return sum(s.get("end", s.get("start", 0)) - s.get("start", 0) for s in sessions)
-
-    def _sessions_by_channel(self, sessions):
+    def _merge_channels(self, days):
         by_ch = {}
-        for s in sessions:
-            cid = str(s.get("channel_id", 0))
-            if cid not in by_ch:
-                by_ch[cid] = {"name": s.get("channel_name", "Неизвестно"), "total": 0.0}
-            by_ch[cid]["total"] += s.get("end", s.get("start", 0)) - s.get("start", 0)
+        for info in days.values():
+            for cid, chinfo in info["channels"].items():
+                if cid not in by_ch:
+                    by_ch[cid] = {"name": chinfo["name"], "total": 0.0}
+                by_ch[cid]["total"] += chinfo["total"]
         return by_ch
 
-    def _sessions_by_day(self, sessions, start_date, end_date):
-        days = {}
-        cur = start_date
-        while cur <= end_date:
-            days[cur.isoformat()] = {"total": 0.0, "channels": {}}
-            cur += datetime.timedelta(days=1)
-        for s in sessions:
-            day = datetime.datetime.utcfromtimestamp(s["start"]).date().isoformat()
-            if day in days:
-                dur = s.get("end", s["start"]) - s["start"]
-                days[day]["total"] += dur
-                cid = str(s.get("channel_id", 0))
-                if cid not in days[day]["channels"]:
-                    days[day]["channels"][cid] = {"name": s.get("channel_name", "Неизвестно"), "total": 0.0}
-                days[day]["channels"][cid]["total"] += dur
-        return days
-
-    def _sessions_by_hour(self, sessions, date_str):
-        hours = {str(h): {"total": 0.0, "channels": {}} for h in range(24)}
-        for s in sessions:
-            s_date = datetime.datetime.utcfromtimestamp(s["start"]).date().isoformat()
-            if s_date == date_str:
-                hour = str(datetime.datetime.utcfromtimestamp(s["start"]).hour)
-                dur = s.get("end", s["start"]) - s["start"]
-                hours[hour]["total"] += dur
-                cid = str(s.get("channel_id", 0))
-                if cid not in hours[hour]["channels"]:
-                    hours[hour]["channels"][cid] = {"name": s.get("channel_name", "Неизвестно"), "total": 0.0}
-                hours[hour]["channels"][cid]["total"] += dur
-        return hours
-
-    def _build_embed(self, user, user_data, group, start_date, end_date, selected_day=None):
-        sessions = user_data.get("sessions", [])
-        range_sessions = self._get_sessions_in_range(sessions, start_date, end_date)
-        period_total = self._sessions_total(range_sessions)
-        all_time = user_data.get("total", 0.0)
-        last_seen = user_data.get("last_seen", 0.0)
+    def _render_view(self, user, group, week_offset, selected_day):
+        """Эмбед и дни с активностью для страницы VoiceView.
+
+        Результат запоминается по версии данных пользователя: пока новых
+        сессий нет, повторные переключения дня и недели берутся из кэша.
+        """
+        store = self.stores.get(user.guild.id)
+        start_date, end_date = self._get_week_bounds(week_offset)
+        key = (user.guild.id, user.id, week_offset, selected_day, store.version(user.id), start_date, group)
+        cached = self._view_cache.get(key)
+        if cached is not None:
+            self._view_cache.move_to_end(key)
+            return cached
+        cached = (
+            self._build_embed(store, user, group, start_date, end_date, selected_day),
+            store.active_days(user.id, start_date, end_date),
+        )
+        self._view_cache[key] = cached
+        if len(self._view_cache) > VIEW_CACHE_SIZE:
+            self._view_cache.popitem(last=False)
+        return cached
+
+    def _build_embed(self, store, user, group, start_date, end_date, selected_day=None):
+        user_data = store.get_user(user.id)
+        days_data = store.by_day(user.id, start_date, end_date)
+        period_total = sum(info["total"] for info in days_data.values())
+        all_time = user_data.total
+        last_seen = user_data.last_seen
 
         embed = disnake.Embed(
             title=f"Голосовая активность — {user.display_name}",
@@ -173,20 +289,19 @@ class Voice(commands.Cog):
         if selected_day:
             day_date = datetime.date.fromisoformat(selected_day)
             day_name = DAYS_RU[day_date.weekday()]
-            day_sessions = [
-                s for s in sessions
-                if datetime.datetime.utcfromtimestamp(s["start"]).date().isoformat() == selected_day
-            ]
-            day_total = self._sessions_total(day_sessions)
+            hourly = store.by_hour(user.id, selected_day)
+            day_total = days_data[selected_day]["total"]
+            value = f"• **За день**: {format_duration(day_total)}"
+            if day_total - sum(hdata["total"] for hdata in hourly.values()) >= 1:
+                value += "\n• Почасовая статистика за этот день уже свёрнута"
 
             embed.add_field(
                 name=f"🛡️ {day_name} ({day_date.strftime('%d.%m.%Y')}):",
-                value=f"• **За день**: {format_duration(day_total)}",
+                value=value,
                 inline=False
             )
 
-            hourly = self._sessions_by_hour(sessions, selected_day)
-            active_hours = [(int(h), d) for h, d in hourly.items() if d["total"] > 0]
+            active_hours = [(h, d) for h, d in hourly.items() if d["total"] > 0]
             active_hours.sort(key=lambda x: x[0])
 
             if active_hours:
@@ -205,7 +320,7 @@ class Voice(commands.Cog):
                     )
         else:
             # Period categories
-            by_channel = self._sessions_by_channel(range_sessions)
+            by_channel = self._merge_channels(days_data)
             if by_channel:
                 cat_lines = [
                     f"**{chinfo['name']}**: {format_duration(chinfo['total'])}"
@@ -216,7 +331,6 @@ class Voice(commands.Cog):
                     embed.add_field(name="• По категориям:", value="\n".join(cat_lines), inline=False)
 
             # Day breakdown
-            days_data = self._sessions_by_day(range_sessions, start_date, end_date)
             cur = start_date
             while cur <= end_date:
                 day_key = cur.isoformat()
@@ -244,39 +358,29 @@ class Voice(commands.Cog):
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        user_id = str(member.id)
-        data = self.load_data()
-
-        async def finish_session():
-            if user_id in self.active:
-                sess = self.active.pop(user_id)
-                duration = time.time() - sess["start"]
-                if duration >= 10:
-                    if user_id not in data:
-                        data[user_id] = {"sessions": [], "total": 0.0, "last_seen": 0.0}
-                    data[user_id].setdefault("sessions", [])
-                    data[user_id]["sessions"].append({
-                        "start": sess["start"],
-                        "end": time.time(),
-                        "channel_id": sess["channel_id"],
-                        "channel_name": sess["channel_name"],
-                    })
-                    data[user_id]["total"] = data[user_id].get("total", 0.0) + duration
-                    data[user_id]["last_seen"] = time.time()
-
-        await finish_session()
-
-        if after.channel:
-            self.active[user_id] = {
-                "start": time.time(),
-                "channel_id": after.channel.id,
-                "channel_name": after.channel.name,
-            }
-
-        self.save_data(data)
-
-    @commands.slash_command(name="voice", description="Голосовая активность участника")
-    async def voice(
+        if not self.scope.tracks_member(member):
+            return
+        # Неотслеживаемые каналы считаем отсутствием в голосе
+        before_channel = before.channel if self.scope.tracks_channel(before.channel) else None
+        after_channel = after.channel if self.scope.tracks_channel(after.channel) else None
+        # Мут, заглушение, стрим, переходы вне зоны учёта — сессия не меняется
+        before_id = before_channel.id if before_channel else None
+        after_id = after_channel.id if after_channel else None
+        if before_id == after_id:
+            return
+
+        key = (member.guild.id, str(member.id))
+        now = time.time()
+        await self._end_session(key, now)
+        if after_channel:
+            self._start_session(key, after_channel, now)
+
+    @commands.slash_command(name="voice", description="Голосовая активность")
+    async def voice(self, inter: disnake.AppCmdInter):
+        pass
+
+    @voice.sub_command(name="stats", description="Голосовая активность участника")
+    async def voice_stats(
         self,
         inter: disnake.AppCmdInter,
         user: disnake.Member = commands.Param(name="участник", default=None)
@@ -285,37 +389,256 @@ class Voice(commands.Cog):
             user = inter.author
 
         config = self._get_config()
-        data = self.load_data()
-        user_data = data.get(str(user.id), {"sessions": [], "total": 0.0, "last_seen": 0.0})
+        await self._store(inter.guild.id)
         group = self._get_user_group(user, config)
-        start_date, end_date = self._get_week_bounds(0)
 
-        embed = self._build_embed(user, user_data, group, start_date, end_date)
-        view = VoiceView(self, user, user_data, group, 0, None)
-        await inter.response.send_message(embed=embed, view=view, ephemeral=True)
+        view = VoiceView(self, user, group, 0, None)
+        await inter.response.send_message(embed=view.embed, view=view, ephemeral=True)
+
+    @voice.sub_command(name="report", description="Сводка голосовой активности состава по неделям")
+    async def voice_report(
+        self,
+        inter: disnake.AppCmdInter,
+        weeks: int = commands.Param(name="недели", default=4, ge=1, le=12)
+    ):
+        config = self._get_config()
+        if self._get_user_group(inter.author, config) == "Участник":
+            await inter.response.send_message("❌ Эта команда доступна только персоналу.", ephemeral=True)
+            return
+
+        store = await self._store(inter.guild.id)
+        staff = []
+        for member in inter.guild.members:
+            if member.bot:
+                continue
+            group = self._get_user_group(member, config)
+            if group != "Участник":
+                staff.append((member, group))
+        if not staff:
+            await inter.response.send_message("❌ Состав не найден.", ephemeral=True)
+            return
+
+        first_monday, _ = self._get_week_bounds(-(weeks - 1))
+        _, last_sunday = self._get_week_bounds(0)
+        matrix = store.week_report([m.id for m, _ in staff], first_monday, weeks)
+        totals = matrix.sum(axis=1)
+
+        lines = []
+        by_group = defaultdict(float)
+        for i in totals.argsort()[::-1]:
+            member, group = staff[i]
+            by_group[group] += totals[i]
+            per_week = " / ".join(format_duration(x) for x in matrix[i])
+            lines.append(f"**{member.display_name}** ({group}): {format_duration(totals[i])}\n└ {per_week}")
+
+        embed = disnake.Embed(
+            title="Голосовая активность состава",
+            color=0x2b2d31
+        )
+        description = f"• **Период**: {first_monday.strftime('%d.%m.%Y')} - {last_sunday.strftime('%d.%m.%Y')}\n"
+        description += "• **Недели**: от старой к текущей\n\n"
+        for line in lines:
+            if len(description) + len(line) > 3900:
+                description += "…"
+                break
+            description += line + "\n"
+        embed.description = description
+        group_lines = [
+            f"**{group}**: {format_duration(total)}"
+            for group, total in sorted(by_group.items(), key=lambda x: -x[1])
+        ]
+        embed.add_field(name="• По группам:", value="\n".join(group_lines), inline=False)
+        await inter.response.send_message(embed=embed, ephemeral=True)
+
+    def _resolve_period(self, period):
+        today = datetime.datetime.utcnow().date()
+        if period == "week":
+            start, end = self._get_week_bounds(0)
+            return week_period(start), start, end
+        if period == "prev_week":
+            start, end = self._get_week_bounds(-1)
+            return week_period(start), start, end
+        first = today.replace(day=1)
+        if period == "prev_month":
+            end = first - datetime.timedelta(days=1)
+            return month_period(end), end.replace(day=1), end
+        next_month = (first + datetime.timedelta(days=32)).replace(day=1)
+        return month_period(first), first, next_month - datetime.timedelta(days=1)
+
+    @voice.sub_command(name="top", description="Таблица лидеров по времени в голосе")
+    async def voice_top(
+        self,
+        inter: disnake.AppCmdInter,
+        period: str = commands.Param(name="период", default="week", choices=TOP_PERIODS),
+        group: str = commands.Param(
+            name="группа", default=None, choices=[label for _, label in STAFF_GROUPS] + ["Участник"]
+        ),
+        channel: disnake.VoiceChannel = commands.Param(name="канал", default=None),
+        limit: int = commands.Param(name="количество", default=10, ge=1, le=25)
+    ):
+        config = self._get_config()
+        store = await self._store(inter.guild.id)
+        key, start_date, end_date = self._resolve_period(period)
+
+        # Участники, покинувшие сервер, и не подходящие под фильтр группы пропускаются
+        groups = {}
+
+        def matches(user_id):
+            member = inter.guild.get_member(int(user_id))
+            if member is None:
+                return False
+            groups[user_id] = (member, self._get_user_group(member, config))
+            return group is None or groups[user_id][1] == group
+
+        top = store.top(key, limit, channel.id if channel else None, matches)
+
+        embed = disnake.Embed(
+            title="Таблица лидеров — голосовая активность",
+            color=0x2b2d31
+        )
+        filters = []
+        if group:
+            filters.append(f"группа {group}")
+        if channel:
+            filters.append(f"канал {channel.mention}")
+        description = (
+            f"• **Период**: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}\n"
+            + (f"• **Фильтр**: {', '.join(filters)}\n" if filters else "")
+            + "\n"
+        )
+        if top:
+            description += "\n".join(
+                f"**{place}.** {groups[user_id][0].mention} ({groups[user_id][1]}): {format_duration(seconds)}"
+                for place, (user_id, seconds) in enumerate(top, 1)
+            )
+        else:
+            description += "Нет активности за выбранный период."
+        embed.description = description
+
+        if not group:
+            by_group = defaultdict(float)
+            for user_id, seconds in store.period_counters(key, channel.id if channel else None).items():
+                if user_id in groups or matches(user_id):
+                    by_group[groups[user_id][1]] += seconds
+            group_lines = [
+                f"**{label}**: {format_duration(total)}"
+                for label, total in sorted(by_group.items(), key=lambda x: -x[1])
+            ]
+            if group_lines:
+                embed.add_field(name="• По группам:", value="\n".join(group_lines), inline=False)
+
+        await inter.response.send_message(embed=embed, ephemeral=True)
+
+    @voice.sub_command(name="export", description="Выгрузить активность состава по дням и каналам")
+    async def voice_export(
+        self,
+        inter: disnake.AppCmdInter,
+        fmt: str = commands.Param(name="формат", default="csv", choices=["csv", "jsonl"]),
+        start: str = commands.Param(name="с", default=None, description="Дата начала, ДД.ММ.ГГГГ"),
+        end: str = commands.Param(name="по", default=None, description="Дата окончания, ДД.ММ.ГГГГ")
+    ):
+        config = self._get_config()
+        if self._get_user_group(inter.author, config) == "Участник":
+            await inter.response.send_message("❌ Эта команда доступна только персоналу.", ephemeral=True)
+            return
+        try:
+            # По умолчанию — те же четыре недели, что и в /voice stats
+            start_date = (
+                datetime.datetime.strptime(start, "%d.%m.%Y").date() if start
+                else self._get_week_bounds(-3)[0]
+            )
+            end_date = datetime.datetime.strptime(end, "%d.%m.%Y").date() if end else self._get_week_bounds(0)[1]
+        except ValueError:
+            await inter.response.send_message("❌ Неверный формат даты. Пример: 01.09.2025", ephemeral=True)
+            return
+
+        await inter.response.defer(ephemeral=True)
+        store = await self._store(inter.guild.id)
+
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                writer = ExportWriter(f, fmt, ["user_name", "group"] + FIELDS)
+                for member in inter.guild.members:
+                    if member.bot:
+                        continue
+                    group = self._get_user_group(member, config)
+                    if group == "Участник":
+                        continue
+                    # Строки одного пользователя собираются в loop, запись — в пуле
+                    rows = [
+                        dict(row, user_name=member.display_name, group=group)
+                        for row in user_rows(store, member.id, start_date, end_date)
+                    ]
+                    if rows:
+                        await run_io(writer.write, rows)
+            filename = f"voice_{start_date.isoformat()}_{end_date.isoformat()}.{fmt}"
+            await inter.edit_original_response(
+                content=f"📄 Голосовая активность состава за {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}",
+                file=disnake.File(path, filename=filename),
+            )
+        finally:
+            os.remove(path)
+
+    @voice.sub_command(name="range", description="Время в голосе за произвольный период")
+    async def voice_range(
+        self,
+        inter: disnake.AppCmdInter,
+        start: str = commands.Param(name="с", description="Дата начала, ДД.ММ.ГГГГ"),
+        end: str = commands.Param(name="по", description="Дата окончания, ДД.ММ.ГГГГ"),
+        user: disnake.Member = commands.Param(name="участник", default=None)
+    ):
+        if not user:
+            user = inter.author
+        try:
+            start_date = datetime.datetime.strptime(start, "%d.%m.%Y").date()
+            end_date = datetime.datetime.strptime(end, "%d.%m.%Y").date()
+        except ValueError:
+            await inter.response.send_message("❌ Неверный формат даты. Пример: 01.09.2025", ephemeral=True)
+            return
+        if start_date > end_date:
+            await inter.response.send_message("❌ Дата начала позже даты окончания.", ephemeral=True)
+            return
+
+        config = self._get_config()
+        store = await self._store(inter.guild.id)
+        total = store.range_total(user.id, start_date, end_date)
+        days = (end_date - start_date).days + 1
+
+        embed = disnake.Embed(
+            title=f"Голосовая активность — {user.display_name}",
+            color=0x2b2d31
+        )
+        embed.set_thumbnail(url=user.display_avatar.url)
+        embed.description = (
+            f"• **Группа состава**: {self._get_user_group(user, config)}\n"
+            f"• **Период**: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')} ({days} дн.)\n"
+            f"• **За период**: {format_duration(total)}\n"
+            f"• **В среднем за день**: {format_duration(total / days)}"
+        )
+        await inter.response.send_message(embed=embed, ephemeral=True)
 
 
 class VoiceView(disnake.ui.View):
-    def __init__(self, cog, user, user_data, group, week_offset, selected_day):
+    def __init__(self, cog, user, group, week_offset, selected_day):
         super().__init__(timeout=300)
         self.cog = cog
         self.user = user
-        self.user_data = user_data
         self.group = group
         self.week_offset = week_offset
         self.selected_day = selected_day
-        self._rebuild_selects()
+        self.embed = None
+        self.refresh()
+
+    def refresh(self):
+        self.embed, days_with_activity = self.cog._render_view(
+            self.user, self.group, self.week_offset, self.selected_day
+        )
+        self._rebuild_selects(days_with_activity)
 
-    def _rebuild_selects(self):
+    def _rebuild_selects(self, days_with_activity):
         self.clear_items()
         start_date, end_date = self.cog._get_week_bounds(self.week_offset)
-        sessions = self.user_data.get("sessions", [])
-        range_sessions = self.cog._get_sessions_in_range(sessions, start_date, end_date)
-
-        days_with_activity = set()
-        for s in range_sessions:
-            day = datetime.datetime.utcfromtimestamp(s["start"]).date().isoformat()
-            days_with_activity.add(day)
 
         # Day select
         day_options = []
@@ -360,19 +683,9 @@ class DaySelect(disnake.ui.StringSelect):
 
     async def callback(self, inter: disnake.MessageInteraction):
         view: VoiceView = self.view
-        selected = self.values[0]
-        view.selected_day = selected
-        start_date, end_date = view.cog._get_week_bounds(view.week_offset)
-
-        data = view.cog.load_data()
-        view.user_data = data.get(str(view.user.id), {"sessions": [], "total": 0.0, "last_seen": 0.0})
-
-        embed = view.cog._build_embed(
-            view.user, view.user_data, view.group,
-            start_date, end_date, selected_day=selected
-        )
-        view._rebuild_selects()
-        await inter.response.edit_message(embed=embed, view=view)
+        view.selected_day = self.values[0]
+        view.refresh()
+        await inter.response.edit_message(embed=view.embed, view=view)
 
 
 class WeekSelect(disnake.ui.StringSelect):
@@ -389,17 +702,8 @@ class WeekSelect(disnake.ui.StringSelect):
         view: VoiceView = self.view
         view.week_offset = int(self.values[0])
         view.selected_day = None
-        start_date, end_date = view.cog._get_week_bounds(view.week_offset)
-
-        data = view.cog.load_data()
-        view.user_data = data.get(str(view.user.id), {"sessions": [], "total": 0.0, "last_seen": 0.0})
-
-        embed = view.cog._build_embed(
-            view.user, view.user_data, view.group,
-            start_date, end_date, selected_day=None
-        )
-        view._rebuild_selects()
-        await inter.response.edit_message(embed=embed, view=view)
+        view.refresh()
+        await inter.response.edit_message(embed=view.embed, view=view)
 
 
 def setup(bot):
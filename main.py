@@ -2,80 +2,144 @@ import disnake
 from disnake.ext import commands, tasks
 import json
 import os
-import datetime
-
-# Используем InteractionBot (не требует префикса)
-intents = disnake.Intents.all()
-bot = commands.InteractionBot(intents=intents)
+from utils.helpers import stores
+from utils import guild_stores, storage
+from utils.expiry import ExpiryProcessor
+from utils.logger import log_action, logs
+from utils.reconcile import reconcile, report_embed
+from utils.rest_queue import LOG, rest
+from utils.scheduler import DeadlineScheduler
 
 with open("config.json") as f:
     config = json.load(f)
 
+# Используем InteractionBot (не требует префикса); с "sharding": true —
+# AutoShardedInteractionBot, число шардов подскажет Discord
+intents = disnake.Intents.all()
+BotBase = commands.AutoShardedInteractionBot if config.get("sharding") else commands.InteractionBot
+
+
+class Bot(BotBase):
+    async def close(self):
+        # Логи из окна пакетной отправки и всё, что ждёт в очереди REST до приоритета
+        # логов включительно, уходят до закрытия соединения; ЛС при выключении не ждём
+        logs.flush()
+        await rest.drain(LOG)
+        await super().close()
+
+
+bot = Bot(intents=intents)
+guild_stores.bind(bot)
+
+# Глубина общей очереди REST: предупреждаем, когда запросы копятся быстрее, чем уходят
+REST_QUEUE_WARN_DEPTH = config.get("rest_queue_warn_depth", 100)
+_rest_backlog = False
+
+
+def watch_rest_queue(stats):
+    global _rest_backlog
+    backlog = stats["depth"] >= REST_QUEUE_WARN_DEPTH
+    if backlog != _rest_backlog:
+        _rest_backlog = backlog
+        state = "растёт" if backlog else "разобрана"
+        print(f"[RestQueue] Очередь {state}: {stats['depth']} в ожидании, по приоритетам {stats['by_priority']}")
+
+
+rest.on_metrics = watch_rest_queue
+
 # Загружаем все коги из папки cogs
 for file in os.listdir("./cogs"):
     if file.endswith(".py") and file != "__init__.py":
         bot.load_extension(f"cogs.{file[:-3]}")
 
-# Автоснятие наказаний по времени
-@tasks.loop(minutes=1)
-async def check_punishments():
-    # Пытаемся загрузить данные, обрабатываем возможные ошибки
-    try:
-        with open("data/punishments.json", "r") as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # Если файл не найден или пуст/повреждён, инициализируем пустой словарь
-        data = {}
-
-    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
-    changed = False
-
-    # Проходим по каждому пользователю
-    for user_id in list(data.keys()):
-        punishments = data[user_id]  # список наказаний
-        new_punishments = []
-        for p in punishments:
-            # Если наказание имеет срок и он истёк
-            if p.get("end_time") and now >= p["end_time"]:
-                # Пытаемся снять роль
-                guild = bot.guilds[0]  # предполагаем, что бот на одном сервере
-                member = guild.get_member(int(user_id))
-                if member:
-                    role = guild.get_role(p["role_id"])
-                    if role:
-                        await member.remove_roles(role)
-                    try:
-                        embed = disnake.Embed(
-                            title="✅ Наказание снято",
-                            color=0x2ecc71
-                        )
-                        if guild.icon:
-                            embed.set_thumbnail(url=guild.icon.url)
-                        embed.add_field(name="Сервер", value=guild.name, inline=False)
-                        embed.add_field(name="Тип наказания", value=p["type"], inline=False)
-                        embed.add_field(name="Причина снятия", value="Срок наказания истёк", inline=False)
-                        await member.send(embed=embed)
-                    except Exception:
-                        pass
-                changed = True
-                # это наказание не добавляем в новый список (оно удаляется)
-            else:
-                new_punishments.append(p)
-
-        # Обновляем список или удаляем пользователя, если наказаний не осталось
-        if new_punishments:
-            data[user_id] = new_punishments
-        else:
-            del data[user_id]
-
-    # Если были изменения, сохраняем обновлённые данные
-    if changed:
-        with open("data/punishments.json", "w") as f:
-            json.dump(data, f, indent=4)
+# Автоснятие наказаний по времени: у каждого сервера свои таймеры, у каждого шарда — свой пул воркеров
+processors = {}  # {shard_id: ExpiryProcessor}
+schedulers = {}  # {guild_id: DeadlineScheduler}
+
+
+def _processor(shard_id):
+    if shard_id not in processors:
+        processors[shard_id] = ExpiryProcessor()
+        processors[shard_id].start()
+    return processors[shard_id]
+
+
+def schedule_guild(guild):
+    """Подключает таймеры сроков к хранилищу сервера (повторный вызов перепланирует всё)."""
+    store = stores.get(guild.id)
+    scheduler = schedulers.get(guild.id)
+    if scheduler is None:
+        async def expire_punishments(now):
+            # Истёкшие наказания удаляются из хранилища сразу, роли и ЛС — в пуле воркеров шарда
+            current = bot.get_guild(guild.id)
+            expired = store.pop_expired(now)
+            if expired and current is not None:
+                _processor(current.shard_id).submit(current, expired)
+
+        scheduler = schedulers[guild.id] = DeadlineScheduler(expire_punishments)
+    # Сроки из хранилища (в том числе истёкшие, пока бот был выключен) планируются заново
+    scheduler.attach(store)
+
+
+async def reconcile_guild(guild, report_untracked):
+    """Сверяет наказания сервера с ролями участников и возвращает сводку (или None)."""
+    if not guild.chunked:
+        # Без полного списка участников отсутствие роли нельзя отличить от отсутствия в кэше
+        print(f"[Reconcile] {guild.name}: список участников ещё не загружен, сверка пропущена")
+        return None
+    dropped, lifted, stale, removed = await reconcile(
+        guild, stores.get(guild.id), _processor(guild.shard_id), config,
+        config.get("reconcile_untracked_roles", False)
+    )
+    if not (removed or report_untracked):
+        stale = {}
+    if not dropped and not lifted and not stale:
+        return None
+    print(f"[Reconcile] {guild.name}: удалено записей {len(dropped)}, сняты роли истёкших наказаний "
+          f"у {len(lifted)}, роли без записи у {len(stale)} участников")
+    return report_embed(dropped, lifted, stale, removed)
+
+
+# Сверка при запуске и затем раз в reconcile_interval_minutes минут
+@tasks.loop(minutes=config.get("reconcile_interval_minutes") or 60)
+async def reconcile_loop():
+    for guild in bot.guilds:
+        try:
+            # Роли без записи, которые не снимаются, попадают в отчёт только при запуске
+            embed = await reconcile_guild(guild, reconcile_loop.current_loop == 0)
+            if embed is not None:
+                await log_action(guild, config["log_channel"], embed)
+        except Exception as e:
+            print(f"[Reconcile] Ошибка сверки {guild.name}: {e}")
+    if not config.get("reconcile_interval_minutes", 60):
+        reconcile_loop.stop()
+
 
 @bot.event
 async def on_ready():
     print(f"Бот запущен как {bot.user}")
-    check_punishments.start()
+    if guild_stores.resolve_home(bot.guilds) is None:
+        print("[GuildStores] Сервер с log_channel не найден: data/*.json не закреплены ни за одним сервером, "
+              "укажите home_guild_id в config.json")
+    for guild in bot.guilds:
+        schedule_guild(guild)
+    if not reconcile_loop.is_running():
+        reconcile_loop.start()
+
+
+@bot.event
+async def on_guild_join(guild):
+    schedule_guild(guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    scheduler = schedulers.pop(guild.id, None)
+    if scheduler is not None:
+        scheduler.cancel()
 
-bot.run(os.getenv("BOT_TOKEN"))
+try:
+    bot.run(os.getenv("BOT_TOKEN"))
+finally:
+    # Сбрасываем отложенные изменения всех хранилищ, чтобы ничего не потерять при выключении
+    storage.shutdown()
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import aiohttp
+import disnake
+
+from utils.rest_queue import DM, channel_route, rest
+
+
+class DMDispatcher:
+    """Фоновая доставка личных сообщений.
+
+    send() только ставит сообщение в ограниченную очередь и сразу
+    возвращается, так что ни ответ на взаимодействие, ни снятие наказаний
+    не ждут ЛС. ``workers`` воркеров отправляют сообщения через общую очередь
+    REST с низшим приоритетом.
+
+    Временные ошибки (5xx, сбой соединения) повторяются до ``retries`` раз
+    с задержкой backoff · 2^n; повтор планируется таймером и не занимает
+    воркер; 429 здесь не повторяется — это уже делает очередь REST.
+    ``timeout`` ограничивает сам запрос, а не ожидание в очереди; истёкший
+    таймаут не повторяется — сообщение могло уже дойти.
+    Пользователи, которым писать нельзя (403 — закрыты ЛС или нет общих
+    серверов), запоминаются на ``closed_ttl`` секунд и всё это время
+    пропускаются без запроса к Discord.
+    """
+
+    def __init__(self, workers=2, queue_size=1000, retries=3, backoff=2.0, timeout=10.0, closed_ttl=6 * 3600):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.closed_ttl = closed_ttl
+        self._closed = {}  # {user_id: time.time(), до которого ЛС не пробуем}
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def send(self, user, **kwargs):
+        """Ставит user.send(**kwargs) в очередь. False — пропущено (ЛС закрыты или очередь полна)."""
+        if self.is_closed(user.id):
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((user, kwargs, 0))
+        except asyncio.QueueFull:
+            print(f"[DM] Очередь переполнена, сообщение для {user.id} отброшено")
+            return False
+        return True
+
+    def is_closed(self, user_id):
+        until = self._closed.get(user_id)
+        if until is None:
+            return False
+        if until <= time.time():
+            del self._closed[user_id]
+            return False
+        return True
+
+    def _mark_closed(self, user_id):
+        now = time.time()
+        if len(self._closed) >= 10000:
+            self._closed = {uid: until for uid, until in self._closed.items() if until > now}
+        self._closed[user_id] = now + self.closed_ttl
+
+    def _retry(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            pass
+
+    async def _worker(self):
+        while True:
+            user, kwargs, attempt = await self._queue.get()
+            try:
+                await self._deliver(user, kwargs, attempt)
+            except Exception as e:
+                print(f"[DM] Ошибка при отправке {user.id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, user, kwargs, attempt):
+        if self.is_closed(user.id):
+            return
+        try:
+            await rest.submit(
+                channel_route(user), lambda: asyncio.wait_for(user.send(**kwargs), self.timeout), DM
+            )
+        except disnake.Forbidden:
+            self._mark_closed(user.id)
+        except asyncio.TimeoutError:
+            print(f"[DM] Таймаут отправки {user.id}, без повтора")
+        except (disnake.HTTPException, aiohttp.ClientConnectionError) as e:
+            transient = not isinstance(e, disnake.HTTPException) or e.status >= 500
+            if transient and attempt < self.retries:
+                delay = self.backoff * 2 ** attempt
+                asyncio.get_running_loop().call_later(delay, self._retry, (user, kwargs, attempt + 1))
+
+
+# Общий диспетчер ЛС процесса: dms.send(member, embed=...)
+dms = DMDispatcher()
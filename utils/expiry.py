@@ -0,0 +1,105 @@
+import asyncio
+import os
+
+import disnake
+
+from utils.dm import dms
+from utils.guild_stores import GuildStores
+from utils.rest_queue import MODERATION, rest
+from utils.storage import json_file
+
+# Роли истёкших наказаний, которые не удалось снять: участника не было в кэше
+# или запрос не прошёл. {user_id: [role_id]} по серверам; их снимает сверка
+pending_lifts = GuildStores(lambda directory: json_file(os.path.join(directory, "pending_lifts.json")))
+
+
+async def remember_lift(guild_id, user_id, role_ids):
+    async with pending_lifts.get(guild_id).transaction() as data:
+        data[str(user_id)] = sorted(set(data.get(str(user_id), [])) | set(role_ids))
+
+
+class ExpiryProcessor:
+    """Снятие истёкших наказаний пулом воркеров.
+
+    Истёкшие наказания группируются по участнику: все его роли снимаются
+    одним изменением через общую очередь REST. Одновременно обрабатывается не больше ``workers``
+    участников, так что волна сроков после рейда не упирается в одну
+    медленную операцию. Уведомления в ЛС уходят в фоновую очередь
+    utils.dm и не задерживают снятие ролей.
+
+    Через тот же пул идут исправления сверки (remove_roles): роли снимаются
+    без уведомлений в ЛС.
+
+    Если участника нет в кэше или снять роли не удалось, срок уже удалён из
+    хранилища — роли тогда записываются в pending_lifts, и их снимет сверка.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self._tasks = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, guild, expired):
+        """Ставит в очередь список (user_id, punishment) одного сервера."""
+        by_user = {}
+        for user_id, p in expired:
+            by_user.setdefault(user_id, []).append(p)
+        for user_id, punishments in by_user.items():
+            roles = {p["role_id"] for p in punishments}
+            self.queue.put_nowait((guild, user_id, roles, None, True, punishments, "Срок наказания истёк"))
+
+    def remove_roles(self, guild, user_id, role_ids, reason, recheck=None, remember=False):
+        """Ставит в очередь снятие ролей без уведомления участника.
+
+        recheck(user_id, role_id) вызывается непосредственно перед снятием:
+        роль остаётся, если он вернул False. С remember=True неудавшееся
+        снятие записывается в pending_lifts.
+        """
+        self.queue.put_nowait((guild, user_id, set(role_ids), recheck, remember, [], reason))
+
+    async def _worker(self):
+        while True:
+            guild, user_id, roles, recheck, remember, punishments, reason = await self.queue.get()
+            try:
+                lifted = await self._lift(guild, user_id, roles, recheck, punishments, reason)
+            except Exception as e:
+                print(f"[Expiry] Ошибка при снятии ролей {user_id}: {e}")
+                lifted = False
+            try:
+                if not lifted and remember:
+                    await remember_lift(guild.id, user_id, roles)
+            except Exception as e:
+                print(f"[Expiry] Не удалось запомнить роли {user_id} для сверки: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _lift(self, guild, user_id, roles, recheck, punishments, reason):
+        """Снимает роли; False — участника нет в кэше."""
+        member = guild.get_member(int(user_id))
+        if member is None:
+            return False
+        if recheck is not None:
+            roles = {role_id for role_id in roles if recheck(user_id, role_id)}
+        if any(r.id in roles for r in member.roles):
+            await rest.edit_roles(member, remove=roles, reason=reason, priority=MODERATION)
+        for p in punishments:
+            dms.send(member, embed=self._dm_embed(guild, p))
+        return True
+
+    @staticmethod
+    def _dm_embed(guild, p):
+        embed = disnake.Embed(
+            title="✅ Наказание снято",
+            color=0x2ecc71
+        )
+        if guild.icon:
+            embed.set_thumbnail(url=guild.icon.url)
+        embed.add_field(name="Сервер", value=guild.name, inline=False)
+        embed.add_field(name="Тип наказания", value=p["type"], inline=False)
+        embed.add_field(name="Причина снятия", value="Срок наказания истёк", inline=False)
+        return embed
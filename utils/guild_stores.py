@@ -0,0 +1,102 @@
+import json
+import os
+
+from utils.storage import atomic_write_json
+
+GUILDS_FILE = "data/guilds.json"
+
+
+def _read_config():
+    try:
+        with open("config.json", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _read_home(config):
+    if config.get("home_guild_id"):
+        return int(config["home_guild_id"])
+    try:
+        with open(GUILDS_FILE, encoding="utf-8") as f:
+            home = json.load(f).get("home_guild_id")
+        return int(home) if home else None
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+_config = _read_config()
+# Сервер, которому принадлежат данные, созданные до разделения по серверам
+_home_guild_id = _read_home(_config)
+_bot = None
+
+
+def bind(bot):
+    """Даёт модулю доступ к кэшу серверов бота, чтобы найти исходный сервер."""
+    global _bot
+    _bot = bot
+
+
+def _owns_log_channel(guild_id):
+    log_channel = _config.get("log_channel")
+    if _bot is None or not log_channel:
+        return False
+    guild = _bot.get_guild(guild_id)
+    return guild is not None and guild.get_channel(log_channel) is not None
+
+
+def is_home(guild_id):
+    """Принадлежат ли серверу старые файлы data/*.json.
+
+    Исходный сервер задаётся home_guild_id в config.json, иначе им считается
+    сервер, где находится log_channel. Найденный сервер сохраняется в
+    data/guilds.json. Выбор не зависит от порядка серверов: пока исходный
+    сервер не найден, старые данные не достаются никому.
+    """
+    global _home_guild_id
+    guild_id = int(guild_id)
+    if _home_guild_id is None and _owns_log_channel(guild_id):
+        _home_guild_id = guild_id
+        atomic_write_json(GUILDS_FILE, {"home_guild_id": _home_guild_id})
+        print(f"[GuildStores] Существующие данные закреплены за сервером {_home_guild_id}")
+    return _home_guild_id == guild_id
+
+
+def resolve_home(guilds):
+    """Исходный сервер среди guilds или None, если его там нет."""
+    for guild in guilds:
+        if is_home(guild.id):
+            return guild.id
+    return _home_guild_id
+
+
+def guild_dir(guild_id):
+    """Каталог данных сервера: data/ для исходного сервера, data/guilds/<id>/ для остальных."""
+    if is_home(guild_id):
+        return "data"
+    return os.path.join("data", "guilds", str(guild_id))
+
+
+class GuildStores:
+    """Отдельное хранилище на каждый сервер, создаётся при первом обращении.
+
+    factory(directory) создаёт хранилище с файлами в каталоге сервера.
+    Каждый шард обращается только к хранилищам своих серверов.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._stores = {}
+
+    def get(self, guild_id):
+        guild_id = int(guild_id)
+        store = self._stores.get(guild_id)
+        if store is None:
+            store = self._stores[guild_id] = self.factory(guild_dir(guild_id))
+        return store
+
+    def items(self):
+        return list(self._stores.items())
+
+    def values(self):
+        return list(self._stores.values())
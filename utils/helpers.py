@@ -1,72 +1,86 @@
 import json
 import datetime
 import os
+from utils.guild_stores import GuildStores
+from utils.punishment_store import PunishmentStore
+from utils.sqlite_store import SqlitePunishmentStore
+from utils.storage import json_file, on_shutdown
 
-PUNISHMENTS_FILE = "data/punishments.json"
+PUNISHMENTS_FILE = "punishments.json"
+PUNISHMENTS_DB = "punishments.db"
 NICKNAMES_FILE = "data/nicknames.json"
 
-def load_punishments():
+def _load_storage_mode():
     try:
-        with open(PUNISHMENTS_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+        with open("config.json", encoding="utf-8") as f:
+            return json.load(f).get("punishments_storage", "json")
+    except FileNotFoundError:
+        return "json"
+
+def _create_store(mode, directory):
+    # "json" — отложенная перезапись файла, "journal" — журнал изменений + снимки,
+    # "sqlite" — база с индексами (при первом запуске переносит punishments.json)
+    json_path = os.path.join(directory, PUNISHMENTS_FILE)
+    if mode == "sqlite":
+        return SqlitePunishmentStore(os.path.join(directory, PUNISHMENTS_DB), legacy_json=json_path)
+    return PunishmentStore(json_path, journal=mode == "journal")
+
+_storage_mode = _load_storage_mode()
 
-def save_punishments(data):
-    os.makedirs("data", exist_ok=True)
-    with open(PUNISHMENTS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-def add_punishment(user_id, p_type, role_id, end_time=None, reason=""):
-    data = load_punishments()
-    user_id = str(user_id)
-    if user_id not in data:
-        data[user_id] = []
-    data[user_id].append({
+# Хранилища наказаний по серверам: stores.get(guild_id)
+stores = GuildStores(lambda directory: _create_store(_storage_mode, directory))
+
+def _flush_all():
+    for store in stores.values():
+        store.flush()
+
+on_shutdown(_flush_all)
+
+def add_punishment(guild_id, user_id, p_type, role_id, end_time=None, reason=""):
+    stores.get(guild_id).add(user_id, {
         "type": p_type,
         "role_id": role_id,
         "end_time": end_time,
         "reason": reason,
         "issued_at": datetime.datetime.now(datetime.timezone.utc).timestamp()
     })
-    save_punishments(data)
-
-def remove_punishment(user_id, role_id):
-    data = load_punishments()
-    user_id = str(user_id)
-    if user_id in data:
-        data[user_id] = [p for p in data[user_id] if p["role_id"] != role_id]
-        if not data[user_id]:
-            del data[user_id]
-        save_punishments(data)
-
-def has_active_punishment(user_id, role_id):
+
+def remove_punishment(guild_id, user_id, role_id):
+    stores.get(guild_id).remove(user_id, role_id)
+
+def has_active_punishment(guild_id, user_id, role_id):
     if not role_id:
         return False
-    data = load_punishments()
-    user_id = str(user_id)
-    if user_id in data:
-        for p in data[user_id]:
-            if p["role_id"] == role_id:
-                return True
-    return False
-
-def count_punishments(user_id, p_type=None):
-    data = load_punishments()
-    user_id = str(user_id)
-    if user_id not in data:
-        return 0
-    if p_type:
-        return sum(1 for p in data[user_id] if p["type"] == p_type)
-    return len(data[user_id])
-
-def load_nicknames():
+    return stores.get(guild_id).has_active(user_id, role_id)
+
+def count_punishments(guild_id, user_id, p_type=None):
+    return stores.get(guild_id).count(user_id, p_type)
+
+def get_user_punishments(guild_id, user_id):
+    return stores.get(guild_id).get_user(user_id)
+
+def get_punishment_history(guild_id, user_id, limit=10):
+    return stores.get(guild_id).history(user_id, limit)
+
+async def get_punishment_status(guild_id, user_id):
+    """Всё, что нужно панели /action, одним запросом: роли, счётчики и ники."""
+    status = stores.get(guild_id).status(user_id)
+    status["nicknames"] = await count_nicknames(user_id)
+    return status
+
+# Кэш nicknames.json: файл перечитывается только после изменения на диске
+_nicknames_cache = {"mtime": None, "data": {}}
+
+async def load_nicknames():
     try:
-        with open(NICKNAMES_FILE, "r") as f:
-            return json.load(f)
+        mtime = os.stat(NICKNAMES_FILE).st_mtime_ns
     except FileNotFoundError:
         return {}
+    if _nicknames_cache["mtime"] != mtime:
+        _nicknames_cache["data"] = await json_file(NICKNAMES_FILE, ensure_ascii=True).load()
+        _nicknames_cache["mtime"] = mtime
+    return _nicknames_cache["data"]
 
-def count_nicknames(user_id):
-    data = load_nicknames()
-    return len(data.get(str(user_id), []))
\ No newline at end of file
+async def count_nicknames(user_id):
+    data = await load_nicknames()
+    return len(data.get(str(user_id), []))
@@ -1,4 +1,71 @@
+import asyncio
+
+from utils.rest_queue import LOG, rest
+
+MAX_EMBEDS = 10  # эмбедов в одном сообщении
+MAX_CHARS = 6000  # суммарный текст эмбедов одного сообщения
+
+
+class LogDispatcher:
+    """Пакетная отправка логов: эмбеды копятся по каналам и уходят пачками.
+
+    Первый эмбед в канал запускает окно ``delay`` секунд; всё, что пришло
+    за это время, отправляется сообщениями до 10 эмбедов (и до 6000 символов)
+    через общую очередь REST с приоритетом логов. Порядок внутри канала
+    сохраняется: пачки одного канала идут одним маршрутом очереди по порядку.
+    Набравшиеся 10 эмбедов отправляются, не дожидаясь окна.
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self._buffers = {}  # {channel_id: (channel, [embed])}
+        self._handles = {}  # {channel_id: asyncio.TimerHandle}
+
+    def add(self, channel, embed):
+        _, embeds = self._buffers.setdefault(channel.id, (channel, []))
+        embeds.append(embed)
+        if len(embeds) >= MAX_EMBEDS:
+            self._flush_channel(channel.id)
+        elif channel.id not in self._handles:
+            loop = asyncio.get_running_loop()
+            self._handles[channel.id] = loop.call_later(self.delay, self._flush_channel, channel.id)
+
+    def _take(self, channel_id):
+        handle = self._handles.pop(channel_id, None)
+        if handle is not None:
+            handle.cancel()
+        return self._buffers.pop(channel_id, (None, []))
+
+    def _flush_channel(self, channel_id):
+        channel, embeds = self._take(channel_id)
+        for batch in _batches(embeds):
+            rest.send(channel, priority=LOG, embeds=batch)
+
+    def flush(self):
+        """Передаёт в очередь REST всё накопленное, не дожидаясь окна (при выключении)."""
+        for channel_id in list(self._buffers):
+            self._flush_channel(channel_id)
+
+
+def _batches(embeds):
+    batch, size = [], 0
+    for embed in embeds:
+        length = len(embed)
+        if batch and (len(batch) >= MAX_EMBEDS or size + length > MAX_CHARS):
+            yield batch
+            batch, size = [], 0
+        batch.append(embed)
+        size += length
+    if batch:
+        yield batch
+
+
+# Общий диспетчер логов процесса
+logs = LogDispatcher()
+
+
 async def log_action(guild, channel_id, embed):
+    # Запись уходит в канал пачкой вместе с соседними в течение окна диспетчера
     channel = guild.get_channel(channel_id)
     if channel:
-        await channel.send(embed=embed)
+        logs.add(channel, embed)
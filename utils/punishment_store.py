@@ -0,0 +1,350 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from utils.storage import atomic_write_json, run_io
+
+
+class PunishmentStore:
+    """Наказания в памяти процесса с отложенной (write-behind) записью на диск.
+
+    Файл читается один раз, все запросы обслуживаются из памяти, а изменения
+    сбрасываются на диск не чаще одного раза в ``flush_delay`` секунд.
+    Срочные наказания дополнительно лежат в min-куче по end_time, поэтому
+    поиск истёкших стоит O(истёкших), а не O(всех наказаний).
+
+    В режиме ``journal=True`` каждое изменение сразу дописывается одной
+    JSONL-строкой в журнал, а полный снимок перезаписывается атомарно только
+    при компактизации (раз в ``compact_delay`` секунд или после
+    ``compact_every`` записей). При старте читается снимок и поверх него
+    проигрывается журнал; записи журнала идемпотентны, поэтому повторное
+    проигрывание уже вошедших в снимок записей безопасно.
+    """
+
+    def __init__(self, path, flush_delay=5.0, journal=False, compact_delay=300.0, compact_every=1000):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.journal_path = os.path.splitext(path)[0] + ".journal.jsonl" if journal else None
+        self.compact_delay = compact_delay
+        self.compact_every = compact_every
+        self.data = {}
+        self.recovered = False  # снимок был повреждён и загружен пустым
+        self._loaded = False
+        self._dirty = False
+        self._flush_handle = None
+        self._flush_task = None
+        self._journal_file = None
+        self._journal_records = 0
+        self._flush_lock = asyncio.Lock()
+        self._write_lock = threading.Lock()
+        self._generation = 0
+        self._written_generation = 0
+        self._expiry_heap = []  # (end_time, seq, user_id, punishment)
+        self._seq = itertools.count()
+        self.on_deadline = None  # вызывается с end_time каждого нового срока (см. DeadlineScheduler)
+
+    # ========== Загрузка ==========
+
+    def load(self):
+        self.data = self._read_snapshot()
+        self._journal_records = 0
+        if self.journal_path:
+            # Сначала журнал, отложенный незавершённой компактизацией, затем текущий
+            for path in (self._old_journal_path, self.journal_path):
+                for record in self._read_journal(path):
+                    self._apply(record)
+                    self._journal_records += 1
+        self._loaded = True
+        self._dirty = self._journal_records > 0
+        self._rebuild_expiry()
+
+    def _read_snapshot(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            # Не теряем данные молча: откладываем повреждённый файл для разбора
+            corrupt_path = f"{self.path}.corrupt-{int(time.time())}"
+            os.replace(self.path, corrupt_path)
+            print(f"[PunishmentStore] {self.path} повреждён ({e}), сохранён как {corrupt_path}")
+            self.recovered = True
+            return {}
+
+    def _read_journal(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # Недописанная строка после падения — всё до неё уже применено
+                        print(f"[PunishmentStore] Пропущена повреждённая запись журнала {path}")
+        except FileNotFoundError:
+            return
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    # ========== Запись ==========
+
+    @property
+    def _old_journal_path(self):
+        return self.journal_path + ".old"
+
+    def flush(self):
+        """Синхронно записывает снимок (при выключении бота и вне event loop)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._dirty:
+            return
+        snapshot, generation = self._begin_flush()
+        try:
+            self._write_snapshot(snapshot, generation)
+        except OSError as e:
+            self._fail_flush(e)
+            return
+        self._finish_flush()
+
+    async def flush_async(self):
+        """Фоновая запись снимка: сериализация и диск — в пуле хранилища."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            snapshot, generation = self._begin_flush()
+            try:
+                await run_io(self._write_snapshot, snapshot, generation)
+            except OSError as e:
+                self._fail_flush(e)
+                self._schedule_flush()
+                return
+            self._finish_flush()
+        if self._dirty:
+            # Пока писали снимок, пришли новые изменения
+            self._schedule_flush()
+
+    def _begin_flush(self):
+        # Копия верхнего уровня: сами словари наказаний после создания не меняются
+        snapshot = {user_id: list(punishments) for user_id, punishments in self.data.items()}
+        self._dirty = False
+        self._generation += 1
+        if self.journal_path:
+            self._rotate_journal()
+        return snapshot, self._generation
+
+    def _fail_flush(self, error):
+        # Повтор планирует только фоновая запись: синхронный flush вне loop
+        # снова вызвал бы себя же через _schedule_flush
+        print(f"[PunishmentStore] Не удалось сохранить {self.path}: {error}")
+        self._dirty = True
+
+    def _finish_flush(self):
+        if self.journal_path:
+            try:
+                os.remove(self._old_journal_path)
+            except FileNotFoundError:
+                pass
+
+    def _write_snapshot(self, snapshot, generation):
+        with self._write_lock:
+            # Более свежий снимок уже записан другим потоком
+            if generation <= self._written_generation:
+                return
+            atomic_write_json(self.path, snapshot)
+            self._written_generation = generation
+
+    def _rotate_journal(self):
+        # Новые записи идут в свежий журнал, пока снимок пишется в фоне;
+        # отложенный журнал удаляется только после успешной записи снимка
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+        self._journal_records = 0
+        if not os.path.exists(self.journal_path):
+            return
+        if os.path.exists(self._old_journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as src, \
+                    open(self._old_journal_path, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self._old_journal_path)
+
+    def _append_journal(self, record):
+        if self._journal_file is None:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            self._journal_file = open(self.journal_path, "a", encoding="utf-8")
+        self._journal_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal_file.flush()
+        self._journal_records += 1
+
+    def _commit(self, record):
+        """Применяет изменение в памяти и ставит его на запись."""
+        self._apply(record)
+        if self.journal_path:
+            self._append_journal(record)
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        self._dirty = True
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты, миграции) пишем сразу
+            self.flush()
+            return
+        if self.journal_path and self._journal_records >= self.compact_every:
+            # Журнал разросся — компактизируем, не дожидаясь таймера
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush_handle = loop.call_soon(self._on_flush_timer)
+            return
+        if self._flush_handle is not None:
+            return
+        delay = self.compact_delay if self.journal_path else self.flush_delay
+        self._flush_handle = loop.call_later(delay, self._on_flush_timer)
+
+    def _on_flush_timer(self):
+        self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self.flush_async())
+
+    # ========== Применение записей ==========
+
+    def _apply(self, record):
+        op = record["op"]
+        user_id = record["user_id"]
+        if op == "add":
+            p = record["punishment"]
+            punishments = self.data.setdefault(user_id, [])
+            if not any(self._same(x, p) for x in punishments):
+                punishments.append(p)
+            return
+        if op == "remove":
+            keep = lambda x: x["role_id"] != record["role_id"]
+        elif op == "expire":
+            keep = lambda x: not self._same(x, record)
+        else:
+            return
+        if user_id in self.data:
+            self.data[user_id] = [x for x in self.data[user_id] if keep(x)]
+            if not self.data[user_id]:
+                del self.data[user_id]
+
+    @staticmethod
+    def _same(a, b):
+        return a["role_id"] == b["role_id"] and a.get("issued_at") == b.get("issued_at")
+
+    # ========== Индекс сроков ==========
+
+    def _rebuild_expiry(self):
+        self._expiry_heap = [
+            (p["end_time"], next(self._seq), user_id, p)
+            for user_id, punishments in self.data.items()
+            for p in punishments
+            if p.get("end_time")
+        ]
+        heapq.heapify(self._expiry_heap)
+        if self.on_deadline is not None:
+            for end_time, _, _, _ in self._expiry_heap:
+                self.on_deadline(end_time)
+
+    def _push_expiry(self, user_id, punishment):
+        heapq.heappush(self._expiry_heap, (punishment["end_time"], next(self._seq), user_id, punishment))
+        if self.on_deadline is not None:
+            self.on_deadline(punishment["end_time"])
+
+    def _is_live(self, user_id, punishment):
+        return any(p is punishment for p in self.data.get(user_id, []))
+
+    def deadlines(self):
+        """end_time всех активных срочных наказаний (для планирования таймеров)."""
+        self._ensure_loaded()
+        return [end_time for end_time, _, user_id, p in self._expiry_heap if self._is_live(user_id, p)]
+
+    # ========== Чтение ==========
+
+    def all(self):
+        self._ensure_loaded()
+        return self.data
+
+    def get_user(self, user_id):
+        self._ensure_loaded()
+        return self.data.get(str(user_id), [])
+
+    def history(self, user_id, limit=10):
+        return self.get_user(user_id)[-limit:]
+
+    def has_active(self, user_id, role_id):
+        return any(p["role_id"] == role_id for p in self.get_user(user_id))
+
+    def count(self, user_id, p_type=None):
+        user_data = self.get_user(user_id)
+        if p_type:
+            return sum(1 for p in user_data if p["type"] == p_type)
+        return len(user_data)
+
+    def status(self, user_id):
+        """Снимок наказаний пользователя за один проход: активные роли и счётчики по типам."""
+        roles = set()
+        counts = {}
+        user_data = self.get_user(user_id)
+        for p in user_data:
+            roles.add(p["role_id"])
+            counts[p["type"]] = counts.get(p["type"], 0) + 1
+        return {"roles": roles, "counts": counts, "total": len(user_data)}
+
+    # ========== Изменение ==========
+
+    def add(self, user_id, punishment):
+        self._ensure_loaded()
+        user_id = str(user_id)
+        self._commit({"op": "add", "user_id": user_id, "punishment": punishment})
+        if punishment.get("end_time"):
+            self._push_expiry(user_id, punishment)
+
+    def remove(self, user_id, role_id):
+        self._ensure_loaded()
+        user_id = str(user_id)
+        if user_id not in self.data:
+            return
+        self._commit({"op": "remove", "user_id": user_id, "role_id": role_id})
+
+    def pop_expired(self, now):
+        """Удаляет истёкшие наказания и возвращает их списком (user_id, punishment)."""
+        self._ensure_loaded()
+        heap = self._expiry_heap
+        expired = []
+        while heap and heap[0][0] <= now:
+            _, _, user_id, p = heapq.heappop(heap)
+            if not self._is_live(user_id, p):
+                continue  # уже снято вручную
+            self._commit({
+                "op": "expire",
+                "user_id": user_id,
+                "role_id": p["role_id"],
+                "issued_at": p.get("issued_at"),
+            })
+            expired.append((user_id, p))
+        return expired
+
+    def replace(self, data):
+        # Полная замена данных сразу пишется снимком, журнал при этом обнуляется
+        self.data = data
+        self._loaded = True
+        self._rebuild_expiry()
+        self._dirty = True
+        self.flush()
@@ -0,0 +1,142 @@
+import time
+
+import disnake
+
+from utils.expiry import pending_lifts
+
+# Роли наказаний из config["roles"]; warn_* и chs_* заведены по веткам
+PUNISHMENT_ROLE_KEYS = ("ban", "mute_text", "mute_voice", "remark", "ostranenie", "nedopusk")
+PUNISHMENT_ROLE_PREFIXES = ("warn_", "chs_")
+# Свежевыданная роль доходит до кэша участников событием шлюза, уже после
+# ответа REST: столько секунд отсутствие роли у новой записи не считаем снятием
+ISSUE_GRACE = 60
+
+
+def punishment_role_ids(config):
+    return {
+        role_id for key, role_id in config.get("roles", {}).items()
+        if role_id and (key in PUNISHMENT_ROLE_KEYS or key.startswith(PUNISHMENT_ROLE_PREFIXES))
+    }
+
+
+def diff(members, punishments, role_ids, now):
+    """Сравнивает наказания хранилища с ролями участников за один проход.
+
+    punishments — {user_id: [punishment]}, role_ids — роли, которые выдаёт
+    только бот. Возвращает (dropped, stale):
+
+    * dropped — [(user_id, role_id)]: активные наказания, чью роль сняли
+      вручную; записи нужно удалить;
+    * stale — {user_id: {role_id}}: роли наказаний без записи — выданные
+      вручную или оставшиеся после сбоя; по умолчанию только в отчёт.
+
+    Истёкшие, но ещё не снятые записи не трогаем — ими занимаются таймеры
+    сроков; выданные меньше ISSUE_GRACE секунд назад — тоже. Участники, которых нет на сервере, не проверяются.
+    """
+    dropped, stale = [], {}
+    for member in members:
+        user_id = str(member.id)
+        has = {r.id for r in member.roles}
+        stored, missing = set(), set()
+        for p in punishments.get(user_id, []):
+            stored.add(p["role_id"])
+            end_time = p.get("end_time")
+            if p["role_id"] in has or (end_time and end_time <= now):
+                continue
+            if (p.get("issued_at") or 0) > now - ISSUE_GRACE:
+                continue
+            missing.add(p["role_id"])
+        dropped.extend((user_id, role_id) for role_id in sorted(missing))
+        extra = (has & role_ids) - stored
+        if extra:
+            stale[user_id] = extra
+    return dropped, stale
+
+
+async def reconcile(guild, store, processor, config, remove_untracked=False):
+    """Приводит хранилище и роли сервера к согласию.
+
+    Лишние записи удаляются из хранилища сразу. Роли истёкших наказаний из
+    pending_lifts снимаются через пул воркеров processor — одной задачей
+    на участника. Остальные роли без записи снимаются только с
+    remove_untracked и только если хранилище не пустое и не восстановлено
+    из повреждённого снимка: иначе «без записи» окажутся все наказания
+    сервера. Возвращает (dropped, lifted, stale, untracked_removed).
+    """
+    punishments = store.all()
+    role_ids = punishment_role_ids(config)
+    role_ids.update(p["role_id"] for records in punishments.values() for p in records)
+    dropped, stale = diff(guild.members, punishments, role_ids, time.time())
+    for user_id, role_id in dropped:
+        store.remove(user_id, role_id)
+
+    # Пока снятие ждёт очереди, наказание могли выдать заново — роль тогда остаётся
+    def untracked(user_id, role_id):
+        return not store.has_active(user_id, role_id)
+
+    lifted = {}
+    lifts = pending_lifts.get(guild.id)
+    if await lifts.load():
+        async with lifts.transaction() as data:
+            for user_id, roles in list(data.items()):
+                member = guild.get_member(int(user_id))
+                # Ушедший участник теряет роли сам; оставшимся — снимаем
+                del data[user_id]
+                if member is None:
+                    continue
+                roles = {r.id for r in member.roles} & set(roles)
+                if roles:
+                    lifted[user_id] = roles
+                    processor.remove_roles(
+                        guild, user_id, roles, "Сверка: срок наказания истёк", untracked, remember=True
+                    )
+    for user_id, roles in lifted.items():
+        if user_id in stale:
+            stale[user_id] -= roles
+            if not stale[user_id]:
+                del stale[user_id]
+
+    untracked_removed = remove_untracked and bool(punishments) and not store.recovered
+    if untracked_removed:
+        for user_id, roles in stale.items():
+            processor.remove_roles(guild, user_id, roles, "Сверка: роль наказания без записи", untracked)
+    return dropped, lifted, stale, untracked_removed
+
+
+def _lines(items, limit=1024):
+    text = ""
+    for i, line in enumerate(items):
+        if len(text) + len(line) + 1 > limit - 20:
+            return text + f"…и ещё {len(items) - i}"
+        text += line + "\n"
+    return text
+
+
+def report_embed(dropped, lifted, stale, removed_roles=False):
+    """Сводка сверки для канала логов."""
+    embed = disnake.Embed(title="🔄 Сверка наказаний", color=0x3498db)
+    if lifted:
+        embed.add_field(
+            name=f"Сняты роли истёкших наказаний ({len(lifted)})",
+            value=_lines([
+                f"<@{user_id}> — " + ", ".join(f"<@&{role_id}>" for role_id in sorted(roles))
+                for user_id, roles in lifted.items()
+            ]),
+            inline=False
+        )
+    if dropped:
+        embed.add_field(
+            name=f"Удалены записи без роли ({len(dropped)})",
+            value=_lines([f"<@{user_id}> — <@&{role_id}>" for user_id, role_id in dropped]),
+            inline=False
+        )
+    if stale:
+        embed.add_field(
+            name=f"{'Сняты' if removed_roles else 'Найдены'} роли без записи ({len(stale)})",
+            value=_lines([
+                f"<@{user_id}> — " + ", ".join(f"<@&{role_id}>" for role_id in sorted(roles))
+                for user_id, roles in stale.items()
+            ]),
+            inline=False
+        )
+    return embed
@@ -0,0 +1,285 @@
+import asyncio
+import itertools
+
+import disnake
+
+# Приоритеты: меньше — раньше. Действия, ответ на которые ждёт модератор,
+# идут первыми, фоновые снятия — следом, логи и ЛС — в последнюю очередь.
+INTERACTION, MODERATION, LOG, DM = range(4)
+
+
+def member_route(guild):
+    # Изменения участников у Discord лимитируются по серверу
+    return ("members", guild.id)
+
+
+def channel_route(channel):
+    # ЛС-каналы (User, Member) не имеют id канала до первого сообщения — маршрут по получателю
+    if isinstance(channel, (disnake.User, disnake.Member)):
+        return ("dm", channel.id)
+    return ("channel", channel.id)
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "route", "factory", "future", "attempts")
+
+    def __init__(self, priority, seq, route, factory, future):
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.factory = factory
+        self.future = future
+        self.attempts = 0
+
+
+class _RoleChange:
+    """Накопленные изменения ролей одного участника до отправки."""
+
+    def __init__(self, member):
+        self.member = member
+        self.base = None  # полный список ролей после set_roles
+        self.add = set()
+        self.remove = set()
+        self.reasons = []
+
+    def merge(self, add=(), remove=(), base=None, reason=None):
+        if base is not None:
+            self.base = set(base)
+            self.add.clear()
+            self.remove.clear()
+        for role_id in add:
+            self.remove.discard(role_id)
+            self.add.add(role_id)
+        for role_id in remove:
+            self.add.discard(role_id)
+            self.remove.add(role_id)
+        if reason and reason not in self.reasons:
+            self.reasons.append(reason)
+
+    async def apply(self):
+        member = self.member
+        reason = "; ".join(self.reasons)[:512] or None
+        if self.base is not None:
+            return await member.edit(roles=self._roles((self.base | self.add) - self.remove), reason=reason)
+        # По одной роли, а не полным списком: кэш ролей участника обновится
+        # событием шлюза уже после ответа, и список из него затёр бы прошлое
+        # изменение и правки администраторов и других ботов
+        if self.add:
+            await member.add_roles(*self._roles(self.add), reason=reason)
+        if self.remove:
+            await member.remove_roles(*self._roles(self.remove), reason=reason)
+        return member
+
+    def _roles(self, role_ids):
+        guild = self.member.guild
+        return [role for role in map(guild.get_role, sorted(role_ids)) if role is not None]
+
+
+class RestQueue:
+    """Общая очередь исходящих REST-запросов к Discord.
+
+    Запросы делятся по маршрутам, близким к бакетам лимитов Discord
+    (изменения участников сервера, сообщения в канал, ЛС): внутри маршрута
+    выполняется не больше одного запроса за раз, а всего одновременно —
+    не больше ``concurrency``. Из готовых к запуску берётся запрос с самым
+    высоким приоритетом, при равных — самый ранний, поэтому порядок внутри
+    маршрута и приоритета сохраняется. Не чаще ``per_second`` запусков
+    в секунду — с запасом до глобального лимита. Если Discord всё же
+    ответил 429, маршрут ставится на паузу на Retry-After и запрос
+    повторяется.
+
+    Изменения ролей одного участника, ещё не ушедшие в Discord, сливаются
+    в одну задачу: выдача и снятие одной и той же роли взаимно отменяются.
+    Роли выдаются и снимаются по одной (add_roles / remove_roles); полный
+    список через member.edit уходит только после set_roles.
+
+    on_metrics(stats) вызывается при каждом изменении очереди со словарём
+    depth / in_flight / by_priority.
+    """
+
+    def __init__(self, concurrency=4, per_second=40, max_attempts=3):
+        self.concurrency = concurrency
+        self.interval = 1.0 / per_second
+        self.max_attempts = max_attempts
+        self.on_metrics = None
+        self._jobs = []
+        self._busy = set()  # маршруты с запросом в работе
+        self._paused = {}  # {маршрут: loop.time() окончания паузы после 429}
+        self._roles = {}  # {(guild_id, member_id): (_RoleChange, _Job)} ещё не начатые
+        self._seq = itertools.count()
+        self._next_start = 0.0
+        self._wakeup = None
+        self._tasks = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    # ========== Постановка в очередь ==========
+
+    def submit(self, route, factory, priority=MODERATION):
+        """Ставит в очередь factory() — корутину запроса. Возвращает future с её результатом.
+
+        Future можно не ждать: ошибка тогда не попадёт в лог как необработанная.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._push(_Job(priority, next(self._seq), route, factory, future))
+        return future
+
+    def send(self, channel, priority=LOG, **kwargs):
+        """channel.send(**kwargs) через очередь; channel может быть участником для ЛС."""
+        return self.submit(channel_route(channel), lambda: channel.send(**kwargs), priority)
+
+    def edit_roles(self, member, add=(), remove=(), reason=None, priority=INTERACTION):
+        """Выдаёт и снимает роли участника, сливаясь с ожидающими изменениями."""
+        return self._role_change(member, priority, add=_ids(add), remove=_ids(remove), reason=reason)
+
+    def set_roles(self, member, roles, reason=None, priority=INTERACTION):
+        """Заменяет все роли участника; последующие edit_roles применяются поверх."""
+        return self._role_change(member, priority, base=_ids(roles), reason=reason)
+
+    def _role_change(self, member, priority, **change):
+        key = (member.guild.id, member.id)
+        pending = self._roles.get(key)
+        if pending is not None:
+            role_change, job = pending
+            role_change.merge(**change)
+            if priority < job.priority:
+                job.priority = priority
+                self._metrics()
+            return job.future
+        role_change = _RoleChange(member)
+        role_change.merge(**change)
+
+        async def apply():
+            # С началом запроса новые изменения копятся уже в следующем
+            self._roles.pop(key, None)
+            return await role_change.apply()
+
+        future = self.submit(member_route(member.guild), apply, priority)
+        self._roles[key] = (role_change, self._jobs[-1])
+        return future
+
+    def _push(self, job):
+        self._jobs.append(job)
+        self._metrics()
+        self._wakeup.set()
+
+    # ========== Выполнение ==========
+
+    def depth(self):
+        return len(self._jobs)
+
+    async def drain(self, max_priority=LOG, timeout=5.0):
+        """Выполняет ожидающие запросы с приоритетом до max_priority прямо в вызывающей задаче.
+
+        Нужна при выключении: воркеры очереди к этому моменту могут быть уже
+        отменены. Запросы идут по порядку постановки, поэтому порядок внутри
+        канала сохраняется; что не успело за timeout секунд — теряется.
+        """
+        jobs = sorted((job for job in self._jobs if job.priority <= max_priority), key=lambda job: job.seq)
+        for job in jobs:
+            self._jobs.remove(job)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for index, job in enumerate(jobs):
+            if job.future.done():
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                print(f"[RestQueue] Не успели отправить при выключении: {len(jobs) - index}")
+                break
+            try:
+                _settle(job.future, job.future.set_result, await asyncio.wait_for(job.factory(), remaining))
+            except Exception as e:
+                _settle(job.future, job.future.set_exception, e)
+
+    def _metrics(self):
+        if self.on_metrics is None:
+            return
+        by_priority = {}
+        for job in self._jobs:
+            by_priority[job.priority] = by_priority.get(job.priority, 0) + 1
+        try:
+            self.on_metrics({"depth": len(self._jobs), "in_flight": len(self._busy), "by_priority": by_priority})
+        except Exception as e:
+            print(f"[RestQueue] Ошибка в on_metrics: {e}")
+
+    def _take(self, now):
+        """Лучший готовый к запуску запрос или (None, через сколько проверить снова)."""
+        best = None
+        retry_in = None
+        for job in self._jobs:
+            if job.route in self._busy:
+                continue
+            paused = self._paused.get(job.route, 0.0)
+            if paused > now:
+                retry_in = paused - now if retry_in is None else min(retry_in, paused - now)
+                continue
+            if best is None or (job.priority, job.seq) < (best.priority, best.seq):
+                best = job
+        if best is not None:
+            self._jobs.remove(best)
+            self._busy.add(best.route)
+        return best, retry_in
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, retry_in = self._take(loop.time())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), retry_in)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._metrics()
+            # Равномерный темп запусков вместо пачки в начале каждой секунды
+            start = max(loop.time(), self._next_start)
+            self._next_start = start + self.interval
+            if start > loop.time():
+                await asyncio.sleep(start - loop.time())
+            try:
+                await self._run(job, loop)
+            finally:
+                self._busy.discard(job.route)
+                self._metrics()
+                self._wakeup.set()
+
+    async def _run(self, job, loop):
+        if job.future.done():
+            return
+        job.attempts += 1
+        try:
+            result = await job.factory()
+        except disnake.HTTPException as e:
+            if e.status == 429 and job.attempts < self.max_attempts:
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+                self._paused[job.route] = loop.time() + retry_after
+                print(f"[RestQueue] 429 на {job.route}, пауза {retry_after:.1f} с")
+                self._jobs.append(job)
+                return
+            _settle(job.future, job.future.set_exception, e)
+        except Exception as e:
+            _settle(job.future, job.future.set_exception, e)
+        else:
+            _settle(job.future, job.future.set_result, result)
+
+
+def _settle(future, setter, value):
+    # Ожидавший мог отменить future (например, по таймауту), пока запрос выполнялся
+    if not future.done():
+        setter(value)
+
+
+def _ids(items):
+    return [item if isinstance(item, int) else item.id for item in items if item is not None]
+
+
+# Общая очередь процесса: rest.edit_roles(...), rest.send(...)
+rest = RestQueue()
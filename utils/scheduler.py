@@ -0,0 +1,61 @@
+import asyncio
+import math
+import time
+
+
+class DeadlineScheduler:
+    """Таймеры asyncio на точные сроки вместо периодического опроса.
+
+    Сроки округляются вверх до целой секунды, и на каждую секунду заводится
+    один loop.call_at: десять наказаний, истекающих в одну секунду, снимаются
+    одним срабатыванием. Между сроками бот ничего не делает.
+
+    callback(now) — корутина, которая снимает всё истёкшее к моменту now.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._handles = {}  # {секунда: asyncio.TimerHandle}
+        self._tasks = set()
+
+    def attach(self, store):
+        """Подписывается на новые сроки хранилища и планирует уже имеющиеся."""
+        store.on_deadline = self.schedule
+        self.reschedule(store.deadlines())
+
+    def schedule(self, deadline):
+        bucket = math.ceil(deadline)
+        if bucket in self._handles:
+            return
+        loop = asyncio.get_running_loop()
+        # call_at работает по монотонным часам loop, сроки — по UNIX-времени
+        delay = bucket - time.time()
+        self._handles[bucket] = loop.call_at(loop.time() + max(delay, 0), self._fire, bucket)
+
+    def reschedule(self, deadlines):
+        """Перепланирует всё заново, например после перезапуска или замены данных."""
+        self.cancel()
+        for deadline in deadlines:
+            self.schedule(deadline)
+
+    def cancel(self):
+        for handle in self._handles.values():
+            handle.cancel()
+        self._handles.clear()
+
+    def _fire(self, bucket):
+        del self._handles[bucket]
+        now = time.time()
+        if now < bucket:
+            # Часы loop чуть опередили системные — дожидаемся своей секунды
+            self.schedule(bucket)
+            return
+        task = asyncio.ensure_future(self._run(now))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, now):
+        try:
+            await self.callback(now)
+        except Exception as e:
+            print(f"[Scheduler] Ошибка при обработке сроков: {e}")
@@ -0,0 +1,222 @@
+import json
+import os
+import sqlite3
+import sys
+
+from utils.punishment_store import PunishmentStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punishments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    role_id INTEGER,
+    end_time REAL,
+    reason TEXT,
+    issued_at REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_punishments_user_role ON punishments (user_id, role_id);
+CREATE INDEX IF NOT EXISTS idx_punishments_end_time ON punishments (end_time) WHERE end_time IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_punishments_type ON punishments (type);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+BASE_FIELDS = ("type", "role_id", "end_time", "reason", "issued_at")
+
+
+class SqlitePunishmentStore:
+    """Наказания в SQLite (WAL) с тем же интерфейсом, что и PunishmentStore.
+
+    Проверки, подсчёты, история и поиск истёкших наказаний выполняются
+    индексными запросами, поэтому объём истории не влияет на время ответа.
+    """
+
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        self.legacy_json = legacy_json
+        self.conn = None
+        self.recovered = False  # как у PunishmentStore; повреждённая база не открывается вовсе
+        self.on_deadline = None  # вызывается с end_time каждого нового срока (см. DeadlineScheduler)
+
+    # ========== Подключение ==========
+
+    def load(self):
+        if self.conn is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        if self.legacy_json:
+            migrate_from_json(self.conn, self.legacy_json)
+
+    def _ensure_loaded(self):
+        if self.conn is None:
+            self.load()
+
+    def flush(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # ========== Преобразование строк ==========
+
+    @staticmethod
+    def _to_row(user_id, p):
+        extra = {k: v for k, v in p.items() if k not in BASE_FIELDS}
+        return (
+            int(user_id), p["type"], p.get("role_id"), p.get("end_time"),
+            p.get("reason", ""), p.get("issued_at"), json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    @staticmethod
+    def _to_dict(row):
+        p = {k: row[k] for k in BASE_FIELDS}
+        if row["extra"]:
+            p.update(json.loads(row["extra"]))
+        return p
+
+    # ========== Чтение ==========
+
+    def all(self):
+        self._ensure_loaded()
+        data = {}
+        for row in self.conn.execute("SELECT * FROM punishments ORDER BY id"):
+            data.setdefault(str(row["user_id"]), []).append(self._to_dict(row))
+        return data
+
+    def get_user(self, user_id):
+        self._ensure_loaded()
+        rows = self.conn.execute(
+            "SELECT * FROM punishments WHERE user_id = ? ORDER BY id", (int(user_id),)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def history(self, user_id, limit=10):
+        self._ensure_loaded()
+        rows = self.conn.execute(
+            "SELECT * FROM punishments WHERE user_id = ? ORDER BY id DESC LIMIT ?", (int(user_id), limit)
+        ).fetchall()
+        return [self._to_dict(row) for row in reversed(rows)]
+
+    def has_active(self, user_id, role_id):
+        self._ensure_loaded()
+        row = self.conn.execute(
+            "SELECT 1 FROM punishments WHERE user_id = ? AND role_id = ? LIMIT 1", (int(user_id), role_id)
+        ).fetchone()
+        return row is not None
+
+    def count(self, user_id, p_type=None):
+        self._ensure_loaded()
+        if p_type:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM punishments WHERE user_id = ? AND type = ?", (int(user_id), p_type)
+            ).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM punishments WHERE user_id = ?", (int(user_id),)
+            ).fetchone()
+        return row[0]
+
+    def status(self, user_id):
+        """Снимок наказаний пользователя одним запросом: активные роли и счётчики по типам."""
+        self._ensure_loaded()
+        roles = set()
+        counts = {}
+        total = 0
+        rows = self.conn.execute(
+            "SELECT role_id, type FROM punishments WHERE user_id = ?", (int(user_id),)
+        )
+        for role_id, p_type in rows:
+            roles.add(role_id)
+            counts[p_type] = counts.get(p_type, 0) + 1
+            total += 1
+        return {"roles": roles, "counts": counts, "total": total}
+
+    def deadlines(self):
+        self._ensure_loaded()
+        rows = self.conn.execute("SELECT DISTINCT end_time FROM punishments WHERE end_time IS NOT NULL")
+        return [row[0] for row in rows]
+
+    # ========== Изменение ==========
+
+    def add(self, user_id, punishment):
+        self._ensure_loaded()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO punishments (user_id, type, role_id, end_time, reason, issued_at, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._to_row(user_id, punishment),
+            )
+        if punishment.get("end_time") and self.on_deadline is not None:
+            self.on_deadline(punishment["end_time"])
+
+    def remove(self, user_id, role_id):
+        self._ensure_loaded()
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM punishments WHERE user_id = ? AND role_id = ?", (int(user_id), role_id)
+            )
+
+    def pop_expired(self, now):
+        """Удаляет истёкшие наказания и возвращает их списком (user_id, punishment)."""
+        self._ensure_loaded()
+        rows = self.conn.execute(
+            "SELECT * FROM punishments WHERE end_time IS NOT NULL AND end_time <= ? ORDER BY end_time",
+            (now,),
+        ).fetchall()
+        if not rows:
+            return []
+        with self.conn:
+            self.conn.executemany("DELETE FROM punishments WHERE id = ?", [(row["id"],) for row in rows])
+        return [(str(row["user_id"]), self._to_dict(row)) for row in rows]
+
+    def replace(self, data):
+        self._ensure_loaded()
+        with self.conn:
+            self.conn.execute("DELETE FROM punishments")
+            self._insert_all(self.conn, data)
+        if self.on_deadline is not None:
+            for end_time in self.deadlines():
+                self.on_deadline(end_time)
+
+    @classmethod
+    def _insert_all(cls, conn, data):
+        conn.executemany(
+            "INSERT INTO punishments (user_id, type, role_id, end_time, reason, issued_at, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (cls._to_row(user_id, p) for user_id, punishments in data.items() for p in punishments),
+        )
+
+
+def migrate_from_json(conn, json_path):
+    """Однократно переносит data/punishments.json (и журнал, если есть) в базу.
+
+    Возвращает число перенесённых наказаний; повторный вызов ничего не делает.
+    """
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+        return 0
+    if not os.path.exists(json_path):
+        return 0
+    legacy = PunishmentStore(json_path, journal=True)
+    legacy.load()
+    data = legacy.all()
+    with conn:
+        SqlitePunishmentStore._insert_all(conn, data)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)", (json_path,))
+    count = sum(len(v) for v in data.values())
+    print(f"[SqlitePunishmentStore] Перенесено наказаний из {json_path}: {count}")
+    return count
+
+
+if __name__ == "__main__":
+    # python -m utils.sqlite_store [punishments.json] [punishments.db]
+    json_path = sys.argv[1] if len(sys.argv) > 1 else "data/punishments.json"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "data/punishments.db"
+    SqlitePunishmentStore(db_path, legacy_json=json_path).load()
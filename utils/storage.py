@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Общий ограниченный пул для сериализации и дисковых операций,
+# чтобы event loop не простаивал на больших файлах или медленном диске
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="storage")
+
+_files = {}
+_shutdown_hooks = []
+
+
+async def run_io(func, *args):
+    """Выполняет блокирующую функцию в пуле хранилища."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+def atomic_write_bytes(path, data):
+    """Пишет данные во временный файл рядом и атомарно подменяет им исходный.
+
+    При падении посреди записи на диске остаётся либо старая, либо новая
+    версия файла, но никогда не обрезанная.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, indent=4, ensure_ascii=True, encoding="utf-8"):
+    """Атомарно записывает data как JSON (см. atomic_write_bytes)."""
+    text = json.dumps(data, indent=indent, ensure_ascii=ensure_ascii)
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+class JsonFile:
+    """JSON-файл с асинхронным чтением/записью вне event loop.
+
+    Запись в один файл сериализуется asyncio.Lock, а сама запись атомарна
+    (временный файл + rename). Для «прочитать-изменить-записать» используйте
+    transaction(): блокировка держится на всё время изменения, поэтому
+    параллельные обработчики не затирают друг друга и не выдают одинаковые
+    номера. Экземпляры общие на процесс — см. json_file().
+    """
+
+    def __init__(self, path, default=dict, indent=4, ensure_ascii=False, encoding="utf-8"):
+        self.path = path
+        self.default = default
+        self.indent = indent
+        self.ensure_ascii = ensure_ascii
+        self.encoding = encoding
+        self.lock = asyncio.Lock()
+
+    def read(self):
+        try:
+            with open(self.path, "r", encoding=self.encoding) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return self.default()
+
+    def write(self, data):
+        atomic_write_json(self.path, data, self.indent, self.ensure_ascii, self.encoding)
+
+    async def load(self):
+        return await run_io(self.read)
+
+    async def save(self, data):
+        # data не должен меняться, пока идёт запись в пуле
+        async with self.lock:
+            await run_io(self.write, data)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """async with file.transaction() as data: ... — изменения сохраняются при выходе без ошибки."""
+        async with self.lock:
+            data = await run_io(self.read)
+            yield data
+            await run_io(self.write, data)
+
+
+def json_file(path, **kwargs):
+    """Возвращает общий для процесса JsonFile для пути."""
+    if path not in _files:
+        _files[path] = JsonFile(path, **kwargs)
+    return _files[path]
+
+
+def on_shutdown(func):
+    """Регистрирует синхронную функцию сброса данных при выключении бота."""
+    _shutdown_hooks.append(func)
+    return func
+
+
+def shutdown():
+    """Вызывается из main.py после остановки бота: сбрасывает все отложенные записи."""
+    for func in _shutdown_hooks:
+        try:
+            func()
+        except Exception as e:
+            print(f"[Storage] Ошибка при сохранении данных: {e}")
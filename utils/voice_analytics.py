@@ -0,0 +1,108 @@
+import datetime
+
+import numpy as np
+
+HOUR = 3600
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def gather(users, user_ids=None):
+    """Склеивает колонки сессий нескольких пользователей в общие массивы.
+
+    Возвращает (ids, owners, starts, ends, channels), где owners[i] — индекс
+    владельца сессии i в списке ids.
+    """
+    ids = list(users) if user_ids is None else [str(uid) for uid in user_ids]
+    owners, starts, ends, channels = [], [], [], []
+    for index, user_id in enumerate(ids):
+        sessions = users.get(user_id)
+        if sessions is None or not len(sessions):
+            continue
+        owners.append(np.full(len(sessions), index, dtype=np.int64))
+        starts.append(np.array(sessions.starts, dtype=np.float64))
+        ends.append(np.array(sessions.ends, dtype=np.float64))
+        channels.append(np.array(sessions.channels, dtype=np.int64))
+    if not owners:
+        empty_f = np.empty(0, dtype=np.float64)
+        empty_i = np.empty(0, dtype=np.int64)
+        return ids, empty_i, empty_f, empty_f, empty_i
+    return ids, np.concatenate(owners), np.concatenate(starts), np.concatenate(ends), np.concatenate(channels)
+
+
+def gather_days(users, ids):
+    """Свёрнутые дневные суммы тех же пользователей: (owners, days, channels, seconds)."""
+    owners, days, channels, seconds = [], [], [], []
+    for index, user_id in enumerate(ids):
+        sessions = users.get(user_id)
+        if sessions is None or not len(sessions.days):
+            continue
+        owners.append(np.full(len(sessions.days), index, dtype=np.int64))
+        days.append(np.array(sessions.days, dtype=np.int64))
+        channels.append(np.array(sessions.day_channels, dtype=np.int64))
+        seconds.append(np.array(sessions.day_seconds, dtype=np.float64))
+    if not owners:
+        empty_i = np.empty(0, dtype=np.int64)
+        return empty_i, empty_i, empty_i, np.empty(0, dtype=np.float64)
+    return np.concatenate(owners), np.concatenate(days), np.concatenate(channels), np.concatenate(seconds)
+
+
+def split_hours(owners, starts, ends, channels):
+    """Режет все сессии по границам часов UTC за один проход.
+
+    Возвращает (owners, hours, channels, seconds) — по строке на каждый
+    кусок сессии внутри одного часа; hours — номер часа от начала эпохи.
+    """
+    valid = ends > starts
+    first = np.floor(starts / HOUR).astype(np.int64)
+    last = np.ceil(ends / HOUR).astype(np.int64) - 1
+    counts = np.where(valid, last - first + 1, 0)
+    rows = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    hours = first[rows] + offsets
+    lo = np.maximum(starts[rows], hours * HOUR)
+    hi = np.minimum(ends[rows], (hours + 1) * HOUR)
+    return owners[rows], hours, channels[rows], hi - lo
+
+
+def group_sum(keys, seconds):
+    """Суммирует seconds по уникальным сочетаниям ключей.
+
+    keys — кортеж целочисленных массивов одной длины. Возвращает
+    (список массивов уникальных ключей, массив сумм).
+    """
+    if not len(seconds):
+        return [np.empty(0, dtype=np.int64) for _ in keys], np.empty(0, dtype=np.float64)
+    stacked = np.stack(keys, axis=1)
+    unique, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=seconds, minlength=len(unique))
+    return [unique[:, i] for i in range(len(keys))], sums
+
+
+def hour_to_day(hours):
+    """Номер часа эпохи → ordinal даты (как date.toordinal())."""
+    return hours // 24 + EPOCH_ORDINAL
+
+
+def day_to_monday(days):
+    """Ordinal даты → ordinal понедельника её недели (ordinal 1 — понедельник)."""
+    return days - (days - 1) % 7
+
+
+def day_to_month(days):
+    """Ordinal даты → номер месяца с января 1970."""
+    return (days - EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def day_matrix(owners, hours, seconds, n_owners, start_date, n_days):
+    """Матрица секунд [владелец, день] за n_days дней начиная со start_date."""
+    days = hour_to_day(hours) - start_date.toordinal()
+    mask = (days >= 0) & (days < n_days)
+    flat = owners[mask] * n_days + days[mask]
+    counts = np.bincount(flat, weights=seconds[mask], minlength=n_owners * n_days)
+    return counts.reshape(n_owners, n_days)
+
+
+def week_matrix(owners, hours, seconds, n_owners, first_monday, n_weeks):
+    """Матрица секунд [владелец, неделя] за n_weeks недель начиная с first_monday."""
+    days = day_matrix(owners, hours, seconds, n_owners, first_monday, n_weeks * 7)
+    return days.reshape(n_owners, n_weeks, 7).sum(axis=2)
@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import csv
+import datetime
+import json
+import os
+import sys
+
+from utils.voice_store import VoiceStore
+
+FIELDS = ["user_id", "date", "channel_id", "channel_name", "seconds"]
+
+
+def user_rows(store, user_id, start_date=None, end_date=None):
+    """Строки экспорта одного пользователя: по дню и каналу, по возрастанию даты.
+
+    В памяти держатся только сутки × каналы этого пользователя, поэтому
+    выгрузка всего состава идёт потоком, пользователь за пользователем.
+    """
+    user_id = str(user_id)
+    start = start_date.isoformat() if start_date else ""
+    end = end_date.isoformat() if end_date else "9999"
+    per_day = {}
+    for day, hours in store.rollups.get(user_id, {}).items():
+        if start <= day <= end:
+            channels = per_day.setdefault(day, {})
+            for hour_channels in hours.values():
+                for channel_id, seconds in hour_channels.items():
+                    channels[channel_id] = channels.get(channel_id, 0.0) + seconds
+    for day, day_channels in store.day_rollups.get(user_id, {}).items():
+        if start <= day <= end:
+            channels = per_day.setdefault(day, {})
+            for channel_id, seconds in day_channels.items():
+                channels[channel_id] = channels.get(channel_id, 0.0) + seconds
+    for day in sorted(per_day):
+        for channel_id, seconds in sorted(per_day[day].items()):
+            yield {
+                "user_id": user_id,
+                "date": day,
+                "channel_id": channel_id,
+                "channel_name": store.channel_name(channel_id),
+                "seconds": round(seconds),
+            }
+
+
+class ExportWriter:
+    """Пишет строки экспорта в открытый текстовый файл как CSV или JSONL."""
+
+    def __init__(self, f, fmt="csv", fields=FIELDS):
+        self.fmt = fmt
+        self.f = f
+        if fmt == "csv":
+            self._csv = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            self._csv.writeheader()
+        elif fmt != "jsonl":
+            raise ValueError(f"неизвестный формат: {fmt}")
+
+    def write(self, rows):
+        if self.fmt == "csv":
+            self._csv.writerows(rows)
+        else:
+            self.f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, "%d.%m.%Y").date()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка голосовой активности по дням и каналам")
+    parser.add_argument("output", help="файл для записи, - для stdout")
+    parser.add_argument("--data", default="data/voice.bin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--from", dest="start", type=_parse_date, help="ДД.ММ.ГГГГ")
+    parser.add_argument("--to", dest="end", type=_parse_date, help="ДД.ММ.ГГГГ")
+    parser.add_argument("--user", action="append", help="ID пользователя, можно несколько раз")
+    args = parser.parse_args(argv)
+
+    # Старый voice.json лежит рядом с voice.bin своего сервера: data/ или data/guilds/<id>/
+    store = VoiceStore(args.data, legacy_json=os.path.join(os.path.dirname(args.data), "voice.json"))
+    asyncio.run(store.ensure_loaded())
+    user_ids = args.user or list(store.users)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        writer = ExportWriter(out, args.format)
+        for user_id in user_ids:
+            writer.write(user_rows(store, user_id, args.start, args.end))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    # python -m utils.voice_export voice.csv [--format jsonl] [--from 01.09.2025] [--to 30.09.2025]
+    main()
@@ -0,0 +1,587 @@
+import asyncio
+import datetime
+import heapq
+import json
+import os
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+from utils import voice_analytics as va
+from utils.storage import atomic_write_bytes, run_io
+
+MAGIC = b"VOIC"
+VERSION = 2
+
+
+def split_by_hour(start, end):
+    """Делит сессию на куски по границам часов UTC: (день, час, секунды).
+
+    Сессия 23:40–01:10 даёт три куска: 20 минут в 23:00 первого дня,
+    час в 00:00 и 10 минут в 01:00 следующего.
+    """
+    pos = start
+    while pos < end:
+        piece_end = min(end, (int(pos // 3600) + 1) * 3600)
+        dt = datetime.datetime.fromtimestamp(pos, datetime.timezone.utc)
+        yield dt.date().isoformat(), dt.hour, piece_end - pos
+        pos = piece_end
+
+
+def week_period(date):
+    """Ключ недели для счётчиков: ("week", ordinal понедельника)."""
+    return "week", date.toordinal() - date.weekday()
+
+
+def month_period(date):
+    """Ключ месяца для счётчиков: ("month", месяцев с января 1970)."""
+    return "month", (date.year - 1970) * 12 + date.month - 1
+
+
+def _days(start_date, end_date):
+    cur = start_date
+    while cur <= end_date:
+        yield cur.isoformat()
+        cur += datetime.timedelta(days=1)
+
+
+class UserSessions:
+    """Сессии одного пользователя колонками: начало, конец, канал.
+
+    Сессии старше срока хранения свёрнуты в дневные суммы по каналам:
+    days (ordinal даты), day_channels и day_seconds.
+    """
+
+    __slots__ = ("starts", "ends", "channels", "days", "day_channels", "day_seconds", "total", "last_seen")
+
+    def __init__(self, total=0.0, last_seen=0.0):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.channels = array("q")
+        self.days = array("q")
+        self.day_channels = array("q")
+        self.day_seconds = array("d")
+        self.total = total
+        self.last_seen = last_seen
+
+    def __len__(self):
+        return len(self.starts)
+
+    def append(self, start, end, channel_id):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.channels.append(channel_id)
+
+
+class DailyIndex:
+    """Префиксные суммы по дням: сумма за любой диапазон дат за O(1).
+
+    cum[i] — секунды с первого дня по день first + i включительно. Новые
+    сессии почти всегда попадают в последний день, и тогда обновление тоже
+    O(1); запись задним числом пересчитывает хвост массива.
+    """
+
+    def __init__(self):
+        self.first = None  # ordinal первого дня
+        self.cum = []
+
+    @classmethod
+    def from_days(cls, ordinals, seconds):
+        """Строит индекс сразу из массивов (ordinal дня, секунды)."""
+        index = cls()
+        if len(ordinals):
+            index.first = int(ordinals.min())
+            dense = np.bincount(ordinals - index.first, weights=seconds)
+            index.cum = np.cumsum(dense).tolist()
+        return index
+
+    def add(self, ordinal, seconds):
+        if self.first is None:
+            self.first = ordinal
+            self.cum = [0.0]
+        elif ordinal < self.first:
+            self.cum[:0] = [0.0] * (self.first - ordinal)
+            self.first = ordinal
+        last = self.first + len(self.cum) - 1
+        if ordinal > last:
+            self.cum.extend([self.cum[-1]] * (ordinal - last))
+        for i in range(ordinal - self.first, len(self.cum)):
+            self.cum[i] += seconds
+
+    def _through(self, ordinal):
+        if self.first is None or ordinal < self.first:
+            return 0.0
+        return self.cum[min(ordinal - self.first, len(self.cum) - 1)]
+
+    def total(self, start_date, end_date):
+        return self._through(end_date.toordinal()) - self._through(start_date.toordinal() - 1)
+
+
+# ========== Бинарный формат ==========
+#
+# "VOIC" u32 версия
+# u32 число каналов, далее: q channel_id, u16 длина, имя в UTF-8
+# u32 число пользователей, далее: q user_id, d total, d last_seen, u32 n,
+#     n×d начала, n×d концы, n×q каналы,
+#     с версии 2: u32 m, m×q дни, m×q каналы, m×d секунды (свёрнутые сессии)
+# Все числа little-endian.
+
+def _column_bytes(column):
+    if sys.byteorder == "little":
+        return column.tobytes()
+    swapped = array(column.typecode, column)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def _read_column(typecode, buf, offset, count):
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    column.frombytes(buf[offset:end])
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column, end
+
+
+def encode(users, channel_names):
+    parts = [MAGIC, struct.pack("<II", VERSION, len(channel_names))]
+    for channel_id, name in channel_names.items():
+        raw = name.encode("utf-8")[:0xFFFF]
+        parts.append(struct.pack("<qH", channel_id, len(raw)))
+        parts.append(raw)
+    parts.append(struct.pack("<I", len(users)))
+    for user_id, sessions in users.items():
+        parts.append(struct.pack("<qddI", int(user_id), sessions.total, sessions.last_seen, len(sessions)))
+        parts.append(_column_bytes(sessions.starts))
+        parts.append(_column_bytes(sessions.ends))
+        parts.append(_column_bytes(sessions.channels))
+        parts.append(struct.pack("<I", len(sessions.days)))
+        parts.append(_column_bytes(sessions.days))
+        parts.append(_column_bytes(sessions.day_channels))
+        parts.append(_column_bytes(sessions.day_seconds))
+    return b"".join(parts)
+
+
+def decode(buf):
+    if buf[:4] != MAGIC:
+        raise ValueError("не файл голосовой активности")
+    version, count = struct.unpack_from("<II", buf, 4)
+    if version not in (1, VERSION):
+        raise ValueError(f"неизвестная версия формата: {version}")
+    offset = 12
+    channel_names = {}
+    for _ in range(count):
+        channel_id, size = struct.unpack_from("<qH", buf, offset)
+        offset += 10
+        channel_names[channel_id] = buf[offset:offset + size].decode("utf-8")
+        offset += size
+    users = {}
+    (count,) = struct.unpack_from("<I", buf, offset)
+    offset += 4
+    for _ in range(count):
+        user_id, total, last_seen, n = struct.unpack_from("<qddI", buf, offset)
+        offset += 28
+        sessions = UserSessions(total, last_seen)
+        sessions.starts, offset = _read_column("d", buf, offset, n)
+        sessions.ends, offset = _read_column("d", buf, offset, n)
+        sessions.channels, offset = _read_column("q", buf, offset, n)
+        if version >= 2:
+            (m,) = struct.unpack_from("<I", buf, offset)
+            offset += 4
+            sessions.days, offset = _read_column("q", buf, offset, m)
+            sessions.day_channels, offset = _read_column("q", buf, offset, m)
+            sessions.day_seconds, offset = _read_column("d", buf, offset, m)
+        users[str(user_id)] = sessions
+    return users, channel_names
+
+
+def from_json(raw):
+    """Переводит старый data/voice.json (оба его формата) в колонки."""
+    users = {}
+    channel_names = {}
+    if not isinstance(raw, dict):
+        return users, channel_names
+    for user_id, udata in raw.items():
+        if not isinstance(udata, dict):
+            continue
+        if "sessions" not in udata:
+            # старый формат: {"verification": X, "mod": Y}
+            total = udata.get("verification", 0) + udata.get("mod", 0)
+            users[user_id] = UserSessions(float(total))
+            continue
+        sessions = UserSessions(float(udata.get("total", 0.0)), float(udata.get("last_seen", 0.0)))
+        for s in udata["sessions"]:
+            channel_id = int(s.get("channel_id", 0))
+            sessions.append(s["start"], s.get("end", s["start"]), channel_id)
+            channel_names[channel_id] = s.get("channel_name", "Неизвестно")
+        users[user_id] = sessions
+    return users, channel_names
+
+
+class ActiveJournal:
+    """Журнал открытых голосовых сессий, переживающий перезапуск бота.
+
+    Вход и выход из канала — по одной дописанной JSONL-строке, раз в минуту
+    добавляется отметка «бот жив». load() возвращает сессии, открытые на
+    момент остановки, с ключами (guild_id, user_id), и время последней
+    отметки: до него сессии ушедших за время простоя участников и
+    закрываются. У записей, сделанных до разделения по серверам, guild_id
+    равен None. Когда строк накапливается
+    ``compact_every``, журнал переписывается одними открытыми сессиями.
+    """
+
+    def __init__(self, path, compact_every=500):
+        self.path = path
+        self.compact_every = compact_every
+        self._file = None
+        self._records = 0
+
+    def load(self):
+        active = {}
+        alive = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # недописанная строка после падения
+                    op = record.pop("op", None)
+                    key = (record.pop("guild_id", None), record.pop("user_id", None))
+                    if op == "open":
+                        active[key] = record
+                    elif op == "close":
+                        active.pop(key, None)
+                    elif op == "alive":
+                        alive = record["ts"]
+                    self._records += 1
+        except FileNotFoundError:
+            pass
+        return active, alive
+
+    def _append(self, record):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._records += 1
+
+    def open(self, key, session):
+        guild_id, user_id = key
+        self._append({"op": "open", "guild_id": guild_id, "user_id": user_id, **session})
+
+    def close(self, key):
+        guild_id, user_id = key
+        self._append({"op": "close", "guild_id": guild_id, "user_id": user_id})
+
+    def alive(self, active, now):
+        if self._records >= self.compact_every:
+            self.checkpoint(active, now)
+        else:
+            self._append({"op": "alive", "ts": now})
+
+    def checkpoint(self, active, now):
+        """Переписывает журнал: только открытые сейчас сессии и отметка времени."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        lines = [
+            json.dumps({"op": "open", "guild_id": guild_id, "user_id": user_id, **sess}, ensure_ascii=False)
+            for (guild_id, user_id), sess in active.items()
+        ]
+        lines.append(json.dumps({"op": "alive", "ts": now}))
+        atomic_write_bytes(self.path, ("\n".join(lines) + "\n").encode("utf-8"))
+        self._records = len(lines)
+
+
+class VoiceStore:
+    """Голосовая активность в памяти с пакетной записью на диск.
+
+    Сессии каждого пользователя хранятся колонками (UserSessions), а
+    названия каналов — один раз в общем словаре. На диске это компактный
+    бинарный файл (см. encode/decode); при первом запуске он создаётся из
+    ``legacy_json``. Файл читается один раз; завершённые сессии добавляются
+    в память, а flush() по таймеру и при выключении пишет файл одним
+    атомарным сохранением, только если с прошлой записи что-то изменилось.
+
+    Для отчётов по каждому пользователю ведутся сводки
+    ``{день: {час: {channel_id: секунды}}}``: они строятся из сессий при
+    загрузке и дополняются при каждой новой сессии, поэтому недели и дни
+    считаются по готовым ячейкам, а не перебором всех сессий. Суммы за
+    произвольный диапазон дат берутся из DailyIndex пользователя. При
+    загрузке сводки всех пользователей строятся векторно (voice_analytics),
+    на нём же считаются серверные отчёты.
+
+    compact() сворачивает сессии старше срока хранения в дневные суммы по
+    каналам: почасовая разбивка за такие дни теряется, а суммы по дням,
+    каналам и диапазонам остаются прежними.
+
+    Для таблицы лидеров ведутся счётчики по неделям и месяцам (см.
+    week_period/month_period), общие и по каналам; top() выбирает лучших
+    кучей, не сортируя всех.
+    """
+
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        self.legacy_json = legacy_json
+        self.users = {}  # {user_id: UserSessions}
+        self.channel_names = {}  # {channel_id: последнее известное название}
+        self.rollups = {}  # {user_id: {day: {hour: {channel_id: seconds}}}}
+        self.day_rollups = {}  # свёрнутые дни: {user_id: {day: {channel_id: seconds}}}
+        self.daily = {}  # {user_id: DailyIndex}
+        self.period_totals = {}  # {period: {user_id: seconds}}
+        self.period_channels = {}  # {period: {channel_id: {user_id: seconds}}}
+        self.versions = {}  # {user_id: число изменений} — для кэшей отрисовки
+        self._generation = 0  # растёт при полной перестройке сводок
+        self._dirty = False
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+
+    # ========== Загрузка и запись ==========
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as f:
+                return decode(f.read()), False
+        except FileNotFoundError:
+            pass
+        if self.legacy_json and os.path.exists(self.legacy_json):
+            with open(self.legacy_json, "r", encoding="utf-8") as f:
+                try:
+                    raw = json.load(f)
+                except json.JSONDecodeError:
+                    raw = {}
+            print(f"[VoiceStore] Перенос {self.legacy_json} в {self.path}")
+            return from_json(raw), True
+        return ({}, {}), False
+
+    async def ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                (self.users, self.channel_names), migrated = await run_io(self._read)
+                self._rebuild_rollups()
+                self._dirty = migrated
+                self._loaded = True
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        # encode() копирует массивы в bytes, после этого event loop может дописывать сессии
+        self._dirty = False
+        data = encode(self.users, self.channel_names)
+        try:
+            async with self._write_lock:
+                await run_io(atomic_write_bytes, self.path, data)
+        except OSError as e:
+            self._dirty = True
+            print(f"[VoiceStore] Не удалось сохранить {self.path}: {e}")
+
+    def flush_sync(self):
+        """Запись при выключении, когда event loop уже остановлен."""
+        if not self._dirty:
+            return
+        atomic_write_bytes(self.path, encode(self.users, self.channel_names))
+        self._dirty = False
+
+    # ========== Сессии ==========
+
+    def get_user(self, user_id):
+        return self.users.get(str(user_id)) or UserSessions()
+
+    def channel_name(self, channel_id):
+        return self.channel_names.get(channel_id, "Неизвестно")
+
+    def add_session(self, user_id, start, end, channel_id, channel_name):
+        user_id = str(user_id)
+        sessions = self.users.get(user_id)
+        if sessions is None:
+            sessions = self.users[user_id] = UserSessions()
+        sessions.append(start, end, channel_id)
+        sessions.total += end - start
+        sessions.last_seen = end
+        self.channel_names[channel_id] = channel_name
+        self._rollup(user_id, start, end, channel_id)
+        self.versions[user_id] = self.versions.get(user_id, 0) + 1
+        self._dirty = True
+
+    def version(self, user_id):
+        """Меняется при каждом изменении данных пользователя."""
+        return self._generation, self.versions.get(str(user_id), 0)
+
+    # ========== Сводки ==========
+
+    def _rebuild_rollups(self):
+        # Все пользователи разом: нарезка по часам и суммирование — в NumPy
+        self._generation += 1
+        ids, owners, starts, ends, channels = va.gather(self.users)
+        owners, hours, channels, seconds = va.split_hours(owners, starts, ends, channels)
+        (owner_keys, hour_keys, channel_keys), sums = va.group_sum((owners, hours, channels), seconds)
+
+        self.rollups = {}
+        for owner, hour, channel_id, total in zip(
+            owner_keys.tolist(), hour_keys.tolist(), channel_keys.tolist(), sums.tolist()
+        ):
+            day = datetime.date.fromordinal(hour // 24 + va.EPOCH_ORDINAL).isoformat()
+            days = self.rollups.setdefault(ids[owner], {})
+            days.setdefault(day, {}).setdefault(hour % 24, {})[channel_id] = total
+
+        self.day_rollups = {}
+        day_owners, day_keys, day_channels, day_seconds = va.gather_days(self.users, ids)
+        for owner, day, channel_id, total in zip(
+            day_owners.tolist(), day_keys.tolist(), day_channels.tolist(), day_seconds.tolist()
+        ):
+            days = self.day_rollups.setdefault(ids[owner], {})
+            days.setdefault(datetime.date.fromordinal(day).isoformat(), {})[channel_id] = total
+
+        all_owners = np.concatenate([owners, day_owners])
+        all_days = np.concatenate([va.hour_to_day(hours), day_keys])
+        all_channels = np.concatenate([channels, day_channels])
+        all_seconds = np.concatenate([seconds, day_seconds])
+
+        (owner_keys, ordinals), sums = va.group_sum((all_owners, all_days), all_seconds)
+        self.daily = {}
+        bounds = np.flatnonzero(np.diff(owner_keys)) + 1
+        for owner_days, day_slice, sum_slice in zip(
+            np.split(owner_keys, bounds), np.split(ordinals, bounds), np.split(sums, bounds)
+        ):
+            if len(owner_days):
+                self.daily[ids[owner_days[0]]] = DailyIndex.from_days(day_slice, sum_slice)
+
+        self.period_totals = {}
+        self.period_channels = {}
+        for kind, periods in (("week", va.day_to_monday(all_days)), ("month", va.day_to_month(all_days))):
+            (owner_keys, period_keys, channel_keys), sums = va.group_sum(
+                (all_owners, periods, all_channels), all_seconds
+            )
+            for owner, period, channel_id, total in zip(
+                owner_keys.tolist(), period_keys.tolist(), channel_keys.tolist(), sums.tolist()
+            ):
+                self._count_period((kind, period), ids[owner], channel_id, total)
+
+    def compact(self, cutoff_date):
+        """Сворачивает сессии, закончившиеся до cutoff_date, в дневные суммы.
+
+        Возвращает число свёрнутых сессий.
+        """
+        cutoff = datetime.datetime.combine(cutoff_date, datetime.time.min, tzinfo=datetime.timezone.utc).timestamp()
+        moved = 0
+        for sessions in self.users.values():
+            starts = np.array(sessions.starts, dtype=np.float64)
+            ends = np.array(sessions.ends, dtype=np.float64)
+            channels = np.array(sessions.channels, dtype=np.int64)
+            old = ends < cutoff
+            count = int(old.sum())
+            if not count:
+                continue
+            _, hours, piece_channels, seconds = va.split_hours(
+                np.zeros(count, dtype=np.int64), starts[old], ends[old], channels[old]
+            )
+            (days, day_channels), day_seconds = va.group_sum(
+                (
+                    np.concatenate([np.array(sessions.days, dtype=np.int64), va.hour_to_day(hours)]),
+                    np.concatenate([np.array(sessions.day_channels, dtype=np.int64), piece_channels]),
+                ),
+                np.concatenate([np.array(sessions.day_seconds, dtype=np.float64), seconds]),
+            )
+            keep = ~old
+            sessions.starts = array("d", starts[keep].tolist())
+            sessions.ends = array("d", ends[keep].tolist())
+            sessions.channels = array("q", channels[keep].tolist())
+            sessions.days = array("q", days.tolist())
+            sessions.day_channels = array("q", day_channels.tolist())
+            sessions.day_seconds = array("d", day_seconds.tolist())
+            moved += count
+        if moved:
+            self._rebuild_rollups()
+            self._dirty = True
+        return moved
+
+    def _rollup(self, user_id, start, end, channel_id):
+        days = self.rollups.setdefault(user_id, {})
+        daily = self.daily.setdefault(user_id, DailyIndex())
+        for day, hour, seconds in split_by_hour(start, end):
+            channels = days.setdefault(day, {}).setdefault(hour, {})
+            channels[channel_id] = channels.get(channel_id, 0.0) + seconds
+            date = datetime.date.fromisoformat(day)
+            daily.add(date.toordinal(), seconds)
+            self._count_period(week_period(date), user_id, channel_id, seconds)
+            self._count_period(month_period(date), user_id, channel_id, seconds)
+
+    def _count_period(self, period, user_id, channel_id, seconds):
+        totals = self.period_totals.setdefault(period, {})
+        totals[user_id] = totals.get(user_id, 0.0) + seconds
+        users = self.period_channels.setdefault(period, {}).setdefault(channel_id, {})
+        users[user_id] = users.get(user_id, 0.0) + seconds
+
+    def _channel_entry(self, channels, channel_id):
+        if channel_id not in channels:
+            channels[channel_id] = {"name": self.channel_name(channel_id), "total": 0.0}
+        return channels[channel_id]
+
+    def week_report(self, user_ids, first_monday, n_weeks):
+        """Матрица секунд [пользователь, неделя] для серверных отчётов."""
+        ids, owners, starts, ends, channels = va.gather(self.users, user_ids)
+        owners, hours, _, seconds = va.split_hours(owners, starts, ends, channels)
+        day_owners, days, _, day_seconds = va.gather_days(self.users, ids)
+        # Свёрнутые дни учитываются как первый час своего дня
+        owners = np.concatenate([owners, day_owners])
+        hours = np.concatenate([hours, (days - va.EPOCH_ORDINAL) * 24])
+        seconds = np.concatenate([seconds, day_seconds])
+        return va.week_matrix(owners, hours, seconds, len(ids), first_monday, n_weeks)
+
+    def period_counters(self, period, channel_id=None):
+        """{user_id: секунды} за период, целиком или в одном канале."""
+        if channel_id is not None:
+            return self.period_channels.get(period, {}).get(channel_id, {})
+        return self.period_totals.get(period, {})
+
+    def top(self, period, k=10, channel_id=None, predicate=None):
+        """k лучших [(user_id, секунды)] за период; predicate(user_id) отсеивает участников."""
+        items = self.period_counters(period, channel_id).items()
+        if predicate is not None:
+            items = ((user_id, seconds) for user_id, seconds in items if predicate(user_id))
+        return heapq.nlargest(k, items, key=lambda x: x[1])
+
+    def range_total(self, user_id, start_date, end_date):
+        """Секунды в голосе за даты start_date..end_date включительно."""
+        daily = self.daily.get(str(user_id))
+        return daily.total(start_date, end_date) if daily else 0.0
+
+    def active_days(self, user_id, start_date, end_date):
+        days = self.rollups.get(str(user_id), {})
+        compacted = self.day_rollups.get(str(user_id), {})
+        return {day for day in _days(start_date, end_date) if day in days or day in compacted}
+
+    def by_day(self, user_id, start_date, end_date):
+        """{день: {"total", "channels": {channel_id: {"name", "total"}}}} за период включительно."""
+        user_days = self.rollups.get(str(user_id), {})
+        compacted = self.day_rollups.get(str(user_id), {})
+        result = {}
+        for day in _days(start_date, end_date):
+            info = {"total": 0.0, "channels": {}}
+            buckets = list(user_days.get(day, {}).values())
+            if day in compacted:
+                buckets.append(compacted[day])
+            for channels in buckets:
+                for channel_id, seconds in channels.items():
+                    info["total"] += seconds
+                    self._channel_entry(info["channels"], channel_id)["total"] += seconds
+            result[day] = info
+        return result
+
+    def by_hour(self, user_id, day):
+        """{час: {"total", "channels": {channel_id: {"name", "total"}}}} за один день."""
+        result = {}
+        for hour, channels in self.rollups.get(str(user_id), {}).get(day, {}).items():
+            info = {"total": 0.0, "channels": {}}
+            for channel_id, seconds in channels.items():
+                info["total"] += seconds
+                self._channel_entry(info["channels"], channel_id)["total"] += seconds
+            result[hour] = info
+        return result